@@ -0,0 +1,107 @@
+"""
+Benchmark: consumo de CPU en reposo y latencia push -> ejecución del bucle de
+ControlThread, antes (polling cada 5 ms + espera activa) y ahora (TaskQueue.wait_ready).
+
+Uso (desde la raíz del proyecto, no necesita X ni Qt):
+    PYTHONPATH=. python bench/bench_control_idle.py
+"""
+import statistics
+import threading
+import time
+from typing import Callable, List, Optional
+from core.vars import TaskQueue
+from src.shared import Task, TaskPacket
+
+
+class Loop:
+    def __init__(self, tqueue: TaskQueue, global_wait: bool):
+        self.tqueue = tqueue
+        self.global_wait = global_wait
+        self.wait: Optional[float] = None
+        self.stop = False
+        self.executed: List[float] = []
+
+    def run_tasks(self):
+        # Equivalente a TaskHandler.run_tasks(1, 1.0)
+        packet = self.tqueue.get()
+        if packet is not None:
+            self.executed.append(time.perf_counter())
+            if packet.task_type == Task.App.Wait:
+                if self.global_wait:
+                    self.wait = time.time() + packet.args[0]
+                else:
+                    self.tqueue.delay(packet.sequence, packet.args[0])
+
+
+def polling_loop(loop: Loop):
+    # ControlThread.run() anterior
+    while not loop.stop:
+        wait_until = loop.wait
+        if wait_until is not None:
+            if time.time() < wait_until:
+                continue
+            loop.wait = None
+            continue
+        time.sleep(0.005)
+        loop.run_tasks()
+
+
+def wakeup_loop(loop: Loop):
+    # ControlThread.run() actual
+    tqueue = loop.tqueue
+    while tqueue.wait_ready(lambda: loop.stop):
+        loop.run_tasks()
+        tqueue.dispatch_done()
+
+
+def cpu_during(seconds: float) -> float:
+    # El hilo principal solo duerme, así que el tiempo de CPU del proceso es
+    # prácticamente el del bucle
+    start = time.process_time()
+    time.sleep(seconds)
+    return (time.process_time() - start) / seconds * 100
+
+
+def measure(name: str, target: Callable[[Loop], None], idle: float, wait: float, pushes: int):
+    loop = Loop(TaskQueue(), global_wait=target is polling_loop)
+    thread = threading.Thread(target=target, args=(loop,))
+    thread.start()
+
+    # 1. Reposo absoluto
+    idle_cpu = cpu_during(idle)
+
+    # 2. Task.App.Wait pendiente (p.ej. el retardo de pegado) con una tarea detrás
+    loop.tqueue.push(TaskPacket(Task.App.Wait, (wait,)))
+    loop.tqueue.push(TaskPacket(Task.App.SendKeystroke))
+    wait_cpu = cpu_during(wait)
+    time.sleep(0.05)
+
+    # 3. Latencia push -> ejecución, cada tarea en su propia secuencia
+    latencies = []
+    for _ in range(pushes):
+        loop.executed.clear()
+        pushed = time.perf_counter()
+        loop.tqueue.push(TaskPacket(Task.FF.Show), loop.tqueue.new_sequence())
+        while not loop.executed:
+            time.sleep(0.0002)
+        latencies.append((loop.executed[0] - pushed) * 1000)
+        time.sleep(0.003)
+
+    loop.stop = True
+    loop.tqueue.wake()
+    thread.join()
+
+    latencies.sort()
+    print(f"{name:>8}: cpu reposo {idle_cpu:6.2f}%  cpu en Wait {wait_cpu:6.2f}%"
+          f"  latencia media {statistics.mean(latencies):.3f} ms"
+          f"  p95 {latencies[int(len(latencies) * 0.95)]:.3f} ms")
+
+
+def main(idle: float = 2.0, wait: float = 1.0, pushes: int = 200):
+    print(f"[ {idle}s reposo, {wait}s de Task.App.Wait, {pushes} pushes ]")
+    for name, target in (("polling", polling_loop), ("wakeup", wakeup_loop)):
+        measure(name, target, idle, wait, pushes)
+
+
+if __name__ == "__main__":
+    main()
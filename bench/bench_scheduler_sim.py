@@ -0,0 +1,179 @@
+"""
+Benchmark: el scheduler real (TaskQueue + TaskHandler + MacroLibrary) sobre
+un SimulatedClock. Miles de envíos simulados en poco tiempo real y con
+latencias exactas, así que se pueden comparar cambios del scheduler y
+comprobar presupuestos con assert.
+
+Los pasos son los de las macros de core/macro.py; solo los handlers se
+sustituyen: cada tarea "cuesta" un tiempo fijo (COSTS) o la media de una
+grabación de core/replay.py si se pasa una. Task.App.Wait usa el de verdad
+(TaskHandler.delay_current). Todas las tareas se ejecutan en el propio
+despachador, como haría un único hilo, para que el resultado sea determinista.
+
+Uso (desde la raíz del proyecto; importa PyQt6/pynput pero no necesita X):
+    PYTHONPATH=. python bench/bench_scheduler_sim.py [num_envios] [grabacion.jsonl]
+"""
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from core.action import TaskHandler
+from core.macro import Macro, MacroLibrary, MacroRun
+from core.vars import Vars
+from src.clock import SimulatedClock
+from src.shared import Task, TaskType
+
+
+# Coste simulado por tarea, en segundos (valores típicos medidos con bspwm)
+COSTS: Dict[TaskType, float] = {
+    Task.App.SaveClipboard: 0.004,
+    Task.FF.CopyInput: 0.004,
+    Task.FF.TypeInput: 0.02,
+    Task.Tar.Focus: 0.003,
+    Task.FF.Hide: 0.001,
+    Task.App.WaitFor: 0.002,
+    Task.App.SendKeystroke: 0.1,
+    Task.FF.ClearInput: 0.0005,
+    Task.App.RestoreClipboard: 0.004,
+    Task.App.SwitchToKeyboard: 0.008,
+    Task.FF.Show: 0.002,
+    Task.FF.Focus: 0.003,
+}
+
+ARGS = {"size": None, "pos": None, "res": None, "tname": None, "tclass": None}
+
+
+class _Stub:
+    # Cualquier método de ff/app/tar: los handlers se reemplazan después
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        return lambda *args, **kwargs: None
+
+
+class SimAction:
+    """
+    Lo que TaskHandler y MacroLibrary usan de core.action.Action.
+    """
+    def __init__(self, clock: SimulatedClock, costs: Dict[TaskType, float]):
+        self.vars = Vars(ARGS, clock)
+        self.ff = self.app = self.tar = _Stub()
+        self.thandler = TaskHandler(self.vars.tqueue, self)
+        # Un único despachador: nada va al pool
+        self.thandler.gui_tasks = set(self.thandler.task_functions)
+        for task_type in self.thandler.task_functions:
+            if task_type in costs:
+                self.thandler.task_functions[task_type] = self._cost(clock, costs[task_type])
+        self.thandler.task_functions[Task.App.Wait] = self.thandler.delay_current
+        self.macros = MacroLibrary(self)
+
+    @staticmethod
+    def _cost(clock: SimulatedClock, seconds: float) -> Callable[..., None]:
+        def handler(*args: Any, **kwargs: Any) -> None:
+            clock.sleep(seconds)
+        return handler
+
+
+def expected(macro: Macro, costs: Dict[TaskType, float]) -> float:
+    return sum(args[0] if task_type == Task.App.Wait else costs[task_type]
+               for task_type, args in macro.steps)
+
+
+def costs_from_recording(path: str) -> Dict[TaskType, float]:
+    from core.replay import TaskReplayer, task_from_name
+    runs: Dict[str, List[float]] = {}
+    for event in TaskReplayer.load(path).events:
+        if event["ev"] == "run":
+            runs.setdefault(event["task"], []).append(event["run"])
+    costs = dict(COSTS)
+    for name, values in runs.items():
+        costs[task_from_name(name)] = statistics.mean(values)
+    return costs
+
+
+def simulate(arrivals: List[Tuple[float, str]],
+             costs: Dict[TaskType, float]) -> Dict[str, List[float]]:
+    """
+    Lanza cada macro en su instante con MacroLibrary.run() y despacha con
+    TaskHandler.run_tasks() de una en una, saltando el reloj al siguiente
+    evento cuando no hay nada listo. Devuelve las latencias (push -> última
+    tarea) por macro.
+    """
+    clock = SimulatedClock()
+    action = SimAction(clock, costs)
+    queue = action.vars.tqueue
+    pending = sorted(arrivals, key=lambda arrival: arrival[0])
+    runs: List[MacroRun] = []
+    next_arrival = 0
+
+    try:
+        while next_arrival < len(pending) or not queue.empty():
+            while next_arrival < len(pending) and pending[next_arrival][0] <= clock.time():
+                seq = action.macros.run(pending[next_arrival][1])
+                run = action.macros.run_for(seq)
+                assert run is not None
+                runs.append(run)
+                next_arrival += 1
+
+            ready_in = queue.next_ready_in()
+            if ready_in == 0.0:
+                action.thandler.run_tasks(1, 0.0)
+                continue
+
+            # Nada listo: saltar al siguiente evento (llegada o fin de un Wait)
+            candidates = []
+            if ready_in is not None:
+                candidates.append(ready_in)
+            if next_arrival < len(pending):
+                candidates.append(pending[next_arrival][0] - clock.time())
+            clock.advance(max(0.0, min(candidates)))
+    finally:
+        action.thandler.shutdown()
+
+    latencies: Dict[str, List[float]] = {}
+    for run in runs:
+        assert run.finished_at is not None, f"{run.macro.name} sin terminar"
+        latencies.setdefault(run.macro.name, []).append(run.finished_at - run.started_at)
+    return latencies
+
+
+def report(title: str, latencies: Dict[str, List[float]], elapsed: float):
+    print(f"{title}  ({elapsed * 1000:.1f} ms reales)")
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        print(f"  {name:>10}: n={len(values):<6} media={statistics.mean(values) * 1000:8.3f} ms"
+              f"  p95={values[int(len(values) * 0.95)] * 1000:8.3f} ms"
+              f"  max={values[-1] * 1000:8.3f} ms")
+
+
+def main(sends: int = 5000, recording: Optional[str] = None):
+    costs = COSTS if recording is None else costs_from_recording(recording)
+    library = SimAction(SimulatedClock(), costs).macros
+    budgets = {name: expected(library.get(name), costs) for name in ("send", "send-xtest", "open")}
+
+    # 1. Un envío aislado tarda exactamente la suma de sus pasos
+    for name in ("send", "send-xtest"):
+        latencies = simulate([(0.0, name)], costs)
+        assert abs(latencies[name][0] - budgets[name]) < 1e-9, latencies
+    print("[ aislado: " + ", ".join(f"{name} {budget * 1000:.3f} ms"
+                                    for name, budget in budgets.items()) + " ]")
+
+    # 2. Un envío cada 2 s con un open (prioridad alta) 1 s después de cada uno
+    arrivals = []
+    for i in range(sends):
+        arrivals.append((i * 2.0, "send"))
+        arrivals.append((i * 2.0 + 1.0, "open"))
+    start = time.perf_counter()
+    latencies = simulate(arrivals, costs)
+    report(f"[ {sends} envíos espaciados ]", latencies, time.perf_counter() - start)
+    assert max(latencies["send"]) <= budgets["send"] + 1e-9
+
+    # 3. Ráfaga: todos los envíos a la vez, un open en medio
+    arrivals = [(0.0, "send") for _ in range(sends // 10)]
+    arrivals.append((0.05, "open"))
+    start = time.perf_counter()
+    latencies = simulate(arrivals, costs)
+    report(f"[ ráfaga de {sends // 10} envíos + open ]", latencies, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+         sys.argv[2] if len(sys.argv) > 2 else None)
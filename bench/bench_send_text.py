@@ -0,0 +1,150 @@
+"""
+Benchmark: envío de texto con XTest (send_mode "xtest") frente al camino del
+portapapeles (send_mode "clipboard": pyperclip.copy + Ctrl+V + restaurar).
+
+Crea su propia ventana (override-redirect, el WM no la gestiona), le da el
+foco y escribe en ella. Mide:
+    - latencia total del envío, desde el inicio hasta que la ventana ha
+      recibido la última tecla (y en el portapapeles, hasta restaurarlo)
+    - caracteres por segundo de esa latencia
+
+El camino del portapapeles reproduce los pasos de la macro "send"
+(core/macro.py) que tocan el texto: guardar, copiar, esperar a que el
+portapapeles lo tenga, Ctrl+V con SystemKeyboard.KEY_HOLD, la espera fija de
+0.15 s y restaurar. La ventana no pega nada: solo se cuenta la V.
+
+Necesita X, pynput y xclip/xsel. Escribe en la ventana del benchmark, pero
+mejor no tocar el teclado mientras corre.
+
+Uso (desde la raíz del proyecto):
+    PYTHONPATH=. python bench/bench_send_text.py [repeticiones]
+"""
+import statistics
+import sys
+import time
+from typing import Dict, List, Tuple
+import pyperclip
+from pynput import keyboard
+from Xlib import X, XK
+from src.sys_display import XConnection, xconn
+from src.sys_keyboard import SystemKeyboard
+from src.xtest_typer import XTestTyper
+
+
+TEXTS: Dict[str, str] = {
+    "ascii-corto": "o/ buenas",
+    "ascii-largo": "Alguien para la roulette de nivel 90? Vamos con tanque y healer, falta DPS.",
+    "cjk": "こんにちは、よろしくお願いします！",
+}
+
+# La espera fija tras el Ctrl+V de la macro "send"
+PASTE_WAIT = 0.15
+EVENT_TIMEOUT = 5.0
+
+
+class Sink:
+    """
+    Ventana que recibe las teclas, en su propia conexión.
+    """
+    def __init__(self):
+        self.conn: XConnection = xconn.open("bench-sink")
+        display = self.conn.display
+        screen = display.screen()
+        self.window = self.conn.root.create_window(
+            0, 0, 200, 50, 0, screen.root_depth,
+            override_redirect=True,
+            event_mask=X.KeyPressMask,
+        )
+        self.window.map()
+        display.sync()
+        self.modifiers = {display.keysym_to_keycode(keysym) for keysym in
+                          (XK.XK_Shift_L, XK.XK_Control_L, XK.XK_ISO_Level3_Shift)}
+
+    def focus(self):
+        self.window.set_input_focus(X.RevertToParent, X.CurrentTime)
+        self.conn.display.sync()
+        self.drain()
+
+    def drain(self):
+        display = self.conn.display
+        while display.pending_events():
+            display.next_event()
+
+    def wait_keys(self, count: int) -> int:
+        # Pulsaciones recibidas sin contar los modificadores
+        display = self.conn.display
+        received = 0
+        deadline = time.perf_counter() + EVENT_TIMEOUT
+        while received < count and time.perf_counter() < deadline:
+            if not display.pending_events():
+                time.sleep(0.0005)
+                continue
+            event = display.next_event()
+            if event.type == X.KeyPress and event.detail not in self.modifiers:
+                received += 1
+        return received
+
+    def close(self):
+        self.window.destroy()
+        xconn.close(self.conn)
+
+
+def send_xtest(sink: Sink, typer: XTestTyper, text: str) -> Tuple[float, int]:
+    start = time.perf_counter()
+    typer.type(text)
+    received = sink.wait_keys(len(text))
+    return time.perf_counter() - start, received
+
+
+def send_clipboard(sink: Sink, sys_kb: SystemKeyboard, text: str) -> Tuple[float, int]:
+    paste = [keyboard.Key.ctrl_l, keyboard.KeyCode.from_char('v')]
+    start = time.perf_counter()
+    stored = pyperclip.paste()
+    pyperclip.copy(text)
+    while pyperclip.paste() != text:
+        time.sleep(0.025)
+    sys_kb.send_keystroke(paste)
+    received = sink.wait_keys(1)
+    time.sleep(PASTE_WAIT)
+    pyperclip.copy(stored)
+    return time.perf_counter() - start, received
+
+
+def report(title: str, text: str, values: List[float]):
+    values.sort()
+    mean = statistics.mean(values)
+    print(f"  {title:>9}: media={mean * 1000:8.2f} ms  p95={values[int(len(values) * 0.95)] * 1000:8.2f} ms"
+          f"  {len(text) / mean:8.1f} car/s")
+
+
+def main(repeat: int = 20):
+    sink = Sink()
+    typer = XTestTyper()
+    sys_kb = SystemKeyboard()
+    stored = pyperclip.paste()
+    try:
+        for name, text in TEXTS.items():
+            results: Dict[str, List[float]] = {"xtest": [], "clipboard": []}
+            for _ in range(repeat):
+                sink.focus()
+                elapsed, received = send_xtest(sink, typer, text)
+                if received != len(text):
+                    print(f"  xtest: {received}/{len(text)} teclas recibidas en {name}")
+                results["xtest"].append(elapsed)
+
+                sink.focus()
+                elapsed, received = send_clipboard(sink, sys_kb, text)
+                if received != 1:
+                    print(f"  clipboard: no ha llegado el Ctrl+V en {name}")
+                results["clipboard"].append(elapsed)
+
+            print(f"[ {name}: {len(text)} caracteres, {repeat} envíos ]")
+            for title, values in results.items():
+                report(title, text, values)
+    finally:
+        pyperclip.copy(stored)
+        sink.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,66 @@
+"""
+Benchmark: WindowManager.find() con índices frente al recorrido lineal anterior.
+
+Uso (desde la raíz del proyecto, no necesita X):
+    PYTHONPATH=. python bench/bench_wm_find.py [num_windows]
+"""
+import sys
+import timeit
+from typing import List, Optional
+from src.sys_window import WindowManager
+from src.wm_backend import FakeBackend
+
+
+def synthetic_window(backend: FakeBackend, i: int) -> int:
+    return backend.create_window(
+        f"Window {i}",
+        f"app{i % 40}.App{i % 40}",
+        desktop=i % 4,
+        pid=1000 + i,
+        w=800, h=600,
+        host="localhost",
+    )
+
+
+def linear_find(wm: WindowManager, tid: Optional[int] = None, tname: Optional[str] = None,
+                tclass: Optional[str] = None) -> List[int]:
+    # Implementación previa: tres getters por ventana en cada llamada
+    result = []
+    for window in wm.windows.values():
+        if tid is not None and window.get_id() != tid:
+            continue
+        if tname is not None and window.get_name() != tname:
+            continue
+        if tclass is not None and window.get_class() != tclass:
+            continue
+        result.append(window.get_id())
+    return result
+
+
+def main(num_windows: int = 300, number: int = 2000):
+    backend = FakeBackend()
+    for i in range(num_windows):
+        synthetic_window(backend, i)
+    wm = WindowManager(backend)
+    wm.update()
+
+    target = wm[wm.ids()[num_windows // 2]]
+    cases = {
+        "name": dict(tname=target.wm_name),
+        "class": dict(tclass=target.wm_class),
+        "name+class": dict(tname=target.wm_name, tclass=target.wm_class),
+        "miss": dict(tname="FINAL FANTASY XIV"),
+    }
+
+    print(f"[ find() con {num_windows} ventanas, {number} llamadas por caso ]")
+    for label, kwargs in cases.items():
+        assert sorted(wm.find(**kwargs)) == sorted(linear_find(wm, **kwargs))
+        linear = timeit.timeit(lambda: linear_find(wm, **kwargs), number=number)
+        indexed = timeit.timeit(lambda: wm.find(**kwargs), number=number)
+        print(f"{label:>12}: lineal {linear / number * 1e6:8.2f} us"
+              f"  indexado {indexed / number * 1e6:8.2f} us"
+              f"  x{linear / indexed:6.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
@@ -1,16 +1,43 @@
 from PyQt6.QtWidgets import QApplication
-from src.shared import ExitReason, TaskType, Task, TaskPacket, TaskFunction
+from src.shared import ExitReason, TaskType, Task, TaskPacket, TaskFunction, TaskPriority, WaitCondition
 from src.exception import MultipleFoundError, NotFoundError
 from core.vars import TaskQueue, Vars
 from core.ffchat import FFChat
-from src.sys_window import WindowManager
+from core.invoker import GuiInvoker
+from core.macro import MacroLibrary
+from core.replay import recorder
+from src.sys_window import IdFormat, WindowManager, WMWindow, format_id
+from src.window_match import WindowMatcher
 from src.sys_keyboard import SystemKeyboard
-from typing import Callable, Tuple, Dict, Any
+from src.metrics import metrics, task_name
+from src.trace import tracer
+from typing import Callable, Tuple, Dict, Any, List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
 import subprocess
-import time
+import threading
 import pyperclip
 
 
+def keyboard_switch_command(keyboard_name: str) -> List[str]:
+    # fcitx5-remote -s keyboard-es | mozc
+    return ['fcitx5-remote', '-s', keyboard_name]
+
+
+def report_keyboard_switch(keyboard_name: str, returncode: Optional[int],
+                           stdout: bytes, stderr: bytes) -> bool:
+    """
+    Logs the result of keyboard_switch_command(). Shared by AppAction and
+    the asyncio engine, which runs the same command as a coroutine.
+    """
+    if returncode == 0:
+        print(f"Switched to input keyboard: {keyboard_name}")
+        print(stdout.decode('utf-8'))
+        return True
+    print(f"Failed to switch to input keyboard: {keyboard_name}")
+    print(stderr.decode('utf-8'))
+    return False
+
+
 class ActionChildren:
     def __init__(self, action: "Action"):
         self._action = action 
@@ -19,10 +46,14 @@ class ActionChildren:
 class TargetAction(ActionChildren):
     def __init__(self, action: "Action"):
         super().__init__(action)
+        arg = action.vars.arg
+        # tname/tclass admiten "re:", "glob:" y "fuzzy:" además de texto exacto
+        self._matcher = WindowMatcher.from_args(arg.tname, arg.tclass, arg.tpid, arg.trole)
+        self._matcher.attach(action.wm)
     
-    def locate_or_stop_task(self):
+    def locate_or_stop_task(self) -> Optional[int]:
         action = self._action
-        tid = ""
+        tid = None
         try:
             tid = action.tar.locate() 
         except MultipleFoundError:
@@ -37,38 +68,50 @@ class TargetAction(ActionChildren):
         return tid
 
     # Target
-    def locate(self) -> str:
+    def locate(self) -> int:
         """
         Localiza la id del Target pero puede lanzar excepciones.
             - MultipleFoundError: -> Múltiples resultados obtenidos al tratar de localizar el Target
             - NotFoundError: -> No se ha encontrado nada 
         Ambas excepciones heredan de NotExactMatch en caso de no necesitar tanta precisión
+
+        Si ya hay un tid fijado y la ventana sigue viva se devuelve sin buscar.
+        Solo se vuelve a escanear cuando la ventana fijada ha desaparecido.
         """
+        tar = self._action.vars.tar
+        tid = tar.peek()
+        if tid is not None and self._action.wm.alive(tid):
+            return tid
+
+        if tid is not None:
+            tar.clear_if(tid)
+        tid = self._scan()
+        tar.tid = tid
+        return tid
+
+    def _scan(self) -> int:
         max_retries = 10
         retry_interval = 0.05
         
         for _ in range(max_retries):
-            vars = self._action.vars
-            tname = vars.arg.tname
-            tclass = vars.arg.tclass
-
+            # update() dispara los callbacks que mantienen el matcher al día
             self._action.wm.update()
-            results = self._action.wm.find(tname=tname, tclass=tclass) 
+            results = self._matcher.matched()
 
             if len(results) > 1:
                 raise MultipleFoundError(results)
             elif len(results) == 1:
-                tid: str = results[0]
+                tid: int = results[0]
                 return tid
 
             # print(f"target no encontrado, windows: {print(self._action.wm)}")
-            time.sleep(retry_interval)
+            self._action.vars.clock.sleep(retry_interval)
         
         raise NotFoundError()
 
     def locate_store_tid(self):
         action = self._action
-        tid = ""
+        tid = None
         try:
             tid = action.tar.locate() 
         except MultipleFoundError:
@@ -79,34 +122,64 @@ class TargetAction(ActionChildren):
             print(f"El programa va a terminar debido a que el target ya no existe")
             action.app.create_stop_task(ExitReason.TargetNotFound, 
                              "Target no encontrado desde el principio. Abre el programa antes de ejecutar esto.\n  Terminando la ejecución.")
-           
-        self._action.vars.tar.tid = tid
+
+        if tid is not None:
+            self._action.vars.tar.tid = tid
+
+    def on_window_removed(self, window: WMWindow):
+        # Solo se suelta el tid; el siguiente locate() vuelve a escanear y si
+        # no hay otro target válido termina con TargetNotFound
+        if self._action.vars.tar.clear_if(window.get_id()):
+            print(f"El target {format_id(window.get_id(), IdFormat.HEX8)} se ha cerrado")
 
     def focus(self):
         tid = self.locate_or_stop_task()
-        self._action.app.focus_bspwm_window(tid)
+        self._action.app.focus_window(tid)
 
     def focused(self):
         return self._action.wm.get_active() == self.locate()
 
 
 class FFAction(ActionChildren):
+    """
+    Los métodos pueden ejecutarse en el pool de TaskHandler; todo lo que toca
+    widgets pasa por self._gui, que lo ejecuta en el hilo de Qt.
+    """
     def __init__(self, ffchat: FFChat, action: "Action"):
         super().__init__(action)
         self._ffchat = ffchat
+        self._gui = GuiInvoker()
 
     def copy_input(self):
-        contenido = self._ffchat.ff_input.text()
+        contenido = self._gui.call(self._ffchat.ff_input.text)
         pyperclip.copy(contenido)
+        self._action.vars.app.copied_text = contenido
+
+    def type_input(self):
+        # Modo "xtest": el texto va directo al target, sin portapapeles
+        contenido = self._gui.call(self._ffchat.ff_input.text)
+        self._action.vars.app.copied_text = contenido
+        self._action.sys_kb.type_text(contenido)
+
+    def wait_hidden(self, timeout: float) -> bool:
+        return self._ffchat.wait_hidden(timeout)
 
     def clear_input(self):
-        self._ffchat.ff_input.clear()
+        self._gui.call(self._ffchat.ff_input.clear)
         
     def update_vars(self):
         action = self._action
-        action.vars.ff.set_visible(self._ffchat.isVisible())                          
+        action.vars.ff.set_visible(self._gui.call(self._ffchat.isVisible))
+
+    def locate(self) -> int:
+        """
+        Id de la ventana de FFChat. Qt ya lo conoce (winId) una vez mapeada,
+        así que solo se busca por título si aún no se ha mostrado nunca.
+        """
+        ffid = self._ffchat.native_id()
+        if ffid is not None:
+            return ffid
 
-    def locate(self):
         max_retries = 10
         retry_interval = 0.05
         
@@ -115,55 +188,63 @@ class FFAction(ActionChildren):
             results = self._action.wm.find(tname="FFChat")
             
             if len(results) == 1:
-                ffid: str = results[0]
+                ffid = results[0]
                 return ffid
             elif len(results) > 1:
                 raise MultipleFoundError(results)
             
-            time.sleep(retry_interval)
+            self._action.vars.clock.sleep(retry_interval)
     
         raise NotFoundError()
     
     def focused(self):
+        ffid = self._ffchat.native_id()
+        if ffid is not None:
+            return self._gui.call(self._ffchat.isVisible) and self._action.wm.get_active() == ffid
         return self._action.wm.get_active() == self.locate()
 
     def show(self):
-        if not self._ffchat.isVisible():
+        if not self._gui.call(self._ffchat.isVisible):
             tid = self._action.tar.locate_or_stop_task()
-            self._action.app.focus_bspwm_window(tid)
-            self._ffchat.show()
+            self._action.app.focus_window(tid)
+            self._gui.call(self._ffchat.show)
 
     def hide(self):
-        if self._ffchat.isVisible():
-            self._ffchat.hide()
+        if self._gui.call(self._ffchat.isVisible):
+            self._gui.call(self._ffchat.hide)
 
     def toggle_show(self):
-        if not self._ffchat.isVisible():
+        if not self._gui.call(self._ffchat.isVisible):
             self.show()
         else:
             self.hide()
     
     def focus(self):
         ffid = self.locate() 
-        self._action.app.focus_bspwm_window(ffid)
+        self._action.app.focus_window(ffid)
 
     def restore(self, show: bool = False):
         if self._action.ff.is_visible():
-            self._action.thandler.push(Task.FF.Hide)
-            self._action.thandler.push(Task.Tar.Focus)
-            self._action.thandler.push(Task.App.Wait, (0.1,))
-            self._action.thandler.push(Task.FF.Restore, (show,))
+            thandler = self._action.thandler
+            seq = thandler.sequence("restore")
+            thandler.push(Task.FF.Hide, sequence=seq)
+            thandler.push(Task.Tar.Focus, sequence=seq)
+            thandler.push(Task.FF.Restore, (show,), sequence=seq)
             return
 
         pos = self._calc_pos(self._action.vars.arg.res,
                              self._action.vars.arg.size,
                              self._action.vars.arg.pos)
-        self._ffchat.relocate(size=self._action.vars.arg.size, pos=pos)
+        self._gui.call(self._ffchat.relocate, size=self._action.vars.arg.size, pos=pos)
         if show:
             self._action.thandler.push(Task.FF.Show)
 
     def is_visible(self):
-        return self._ffchat.isVisible()
+        return self._gui.call(self._ffchat.isVisible)
+
+    def shutdown(self):
+        # Los workers bloqueados en _gui.call fallan en vez de esperar a Qt
+        self._gui.shutdown()
 
     def _calc_pos(self,
                        res: Tuple[int, int],
@@ -183,6 +264,9 @@ class FFAction(ActionChildren):
 
 
 class AppAction(ActionChildren):
+    # Cada pyperclip.paste() lanza xclip/xsel: no sondear más a menudo
+    CLIPBOARD_POLL = 0.025
+
     def __init__(self, app: QApplication, stop_function, action: "Action"):
         super().__init__(action)
         self._app = app
@@ -192,7 +276,39 @@ class AppAction(ActionChildren):
         self._action.wm.update()
 
     def wait(self, value: float):
-        self._action.vars.app.wait = time.time() + value
+        # Solo retrasa la secuencia que contiene el Wait
+        self._action.thandler.delay_current(value)
+
+    def wait_for(self, condition: WaitCondition, timeout: float) -> bool:
+        """
+        Blocks until `condition` holds or `timeout` passes, so the sequence
+        only waits as long as this machine needs. Returns False on timeout;
+        the sequence goes on anyway, as it did with the fixed Wait.
+        """
+        if condition == WaitCondition.TargetFocused:
+            tid = self._action.tar.locate_or_stop_task()
+            ok = tid is not None and self._action.wm.active.wait_for(tid, timeout)
+        elif condition == WaitCondition.FFChatHidden:
+            ok = self._action.ff.wait_hidden(timeout)
+        elif condition == WaitCondition.ClipboardReady:
+            text = self._action.vars.app.copied_text
+            ok = self._poll(lambda: pyperclip.paste() == text, timeout, self.CLIPBOARD_POLL)
+        else:
+            raise ValueError(f"Condición de espera desconocida: {condition}")
+
+        if not ok:
+            print(f"WaitFor {condition.name}: sin cumplirse tras {timeout}s, se continúa")
+        return ok
+
+    def _poll(self, predicate: Callable[[], bool], timeout: float, interval: float = 0.005) -> bool:
+        # Para lo que no tiene notificación (el portapapeles va por xclip/xsel)
+        clock = self._action.vars.clock
+        deadline = clock.monotonic() + timeout
+        while not predicate():
+            if clock.monotonic() >= deadline:
+                return False
+            clock.sleep(interval)
+        return True
 
     def save_clipboard(self):
         clipboard = pyperclip.paste() 
@@ -200,27 +316,26 @@ class AppAction(ActionChildren):
         print(f"cliboard guardado: {self._action.vars.app.stored_clipboard}")
 
     def restore_clipboard(self):
-        clipboard = self._action.vars.app.stored_clipboard
+        # Solo si SaveClipboard ha llegado a ejecutarse: un envío cancelado
+        # antes no ha tocado el portapapeles y no hay nada que devolver
+        app_vars = self._action.vars.app
+        clipboard = app_vars.stored_clipboard
+        if clipboard is None:
+            return
+        app_vars.stored_clipboard = None
         pyperclip.copy(clipboard)
 
-    def send_keystroke(self, keys):
-        self._action.sys_kb.send_keystroke(keys)
+    def send_keystroke(self, keys, hold: Optional[float] = None):
+        self._action.sys_kb.send_keystroke(keys, hold)
 
-    def switch_to_keyboard(self, keyboard_name):
-        # fcitx5-remote -s keyboard-es | mozc
-        try:
-            # Ejecutar el comando fcitx5-remote con el nombre del teclado proporcionado
-            result = subprocess.run(
-                ['fcitx5-remote', '-s', keyboard_name], 
-                check=True, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE
-            )
-            print(f"Switched to input keyboard: {keyboard_name}")
-            print(result.stdout.decode('utf-8'))
-        except subprocess.CalledProcessError as e:
-            print(f"Failed to switch to input keyboard: {keyboard_name}")
-            print(e.stderr.decode('utf-8'))
+    def switch_to_keyboard(self, keyboard_name) -> bool:
+        result = subprocess.run(
+            keyboard_switch_command(keyboard_name),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        return report_keyboard_switch(keyboard_name, result.returncode,
+                                      result.stdout, result.stderr)
 
     def toggle_focus(self):
         ffvisible = self._action.ff.is_visible()
@@ -231,8 +346,18 @@ class AppAction(ActionChildren):
         else:
             self._action.ff.focus()
 
-    def focus_bspwm_window(self, id: str):
-        subprocess.run(["bspc", "node", id, "-f"])
+    def resync_modifiers(self, active_id: Optional[int] = None):
+        # Al cambiar el foco se puede perder la liberación de un modificador
+        try:
+            self._action.sys_kb.resync()
+        except Exception as e:
+            print(f"No se han podido resincronizar los modificadores: {e}")
+
+    def focus_window(self, id: Optional[int]):
+        if id is None:
+            return
+        if not self._action.wm.focus(id):
+            print(f"No se ha podido confirmar el focus de {format_id(id, IdFormat.HEX8)}")
 
     def create_stop_task(self,
                             reason: ExitReason = ExitReason.Unknown,
@@ -243,15 +368,19 @@ class AppAction(ActionChildren):
             print("Se ha intentado crear una task de salida extra antes de procesar la primera: ", end="")
             print(f"reason: {reason}, extra_msg: {extra_msg}")
             print("Acción: no la procesamos y abandonamos create_stop_task")
+            return
         self._action.vars.app.assign_stop_vars(reason, extra_msg)
 
         if clear_tasks_before:
             self._action.thandler.clear()
 
+        # Exit se adelanta a todo lo pendiente, esperas incluidas
         self._action.thandler.push(
                 Task.App.Exit,
                 (reason, extra_msg),
-                {}
+                {},
+                sequence=self._action.thandler.sequence("exit"),
+                priority=TaskPriority.Exit
             ) 
 
     def stop_caller(self, reason: ExitReason, extra_msg: str):
@@ -262,9 +391,25 @@ class AppAction(ActionChildren):
 
 
 class TaskHandler(ActionChildren):
+    # Tareas que solo tocan widgets o el propio scheduler: se ejecutan en el
+    # hilo de Qt. El resto bloquea (subprocesos, X, portapapeles, sleeps) y va
+    # al pool, reteniendo su secuencia hasta que termina para no perder el orden.
+    gui_tasks: Set[TaskType] = {
+        Task.FF.Hide,
+        Task.FF.ClearInput,
+        Task.FF.Restore,
+        Task.App.Exit,
+        Task.App.Wait,
+    }
+    POOL_WORKERS = 4
+
     def __init__(self, task_queue: TaskQueue, action: "Action"):
         super().__init__(action)
         self._queue = task_queue
+        self._clock = task_queue.clock
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=self.POOL_WORKERS,
+                                        thread_name_prefix="task")
         self.task_functions: Dict[TaskType, TaskFunction] = {
             Task.FF.Show: self._action.ff.show,
             Task.FF.Hide: self._action.ff.hide,
@@ -272,6 +417,7 @@ class TaskHandler(ActionChildren):
             Task.FF.Focus: self._action.ff.focus,
             Task.FF.Restore: self._action.ff.restore,
             Task.FF.CopyInput: self._action.ff.copy_input,
+            Task.FF.TypeInput: self._action.ff.type_input,
             Task.FF.ClearInput: self._action.ff.clear_input,
 
             Task.Tar.Focus: self._action.tar.focus,
@@ -283,6 +429,7 @@ class TaskHandler(ActionChildren):
             Task.App.SendKeystroke: self._action.app.send_keystroke,
             Task.App.SwitchToKeyboard: self._action.app.switch_to_keyboard,
             Task.App.Wait: self._action.app.wait,
+            Task.App.WaitFor: self._action.app.wait_for,
             Task.App.UpdateWindows: self._action.app.update_windows,
         }
 
@@ -296,50 +443,146 @@ class TaskHandler(ActionChildren):
         :param max_tasks: Maximum number of tasks to execute. If None, execute all available tasks.
         :param duration: Time in seconds to run the task execution. If None, run until the queue is empty.
         """
-        start_time = time.time()
+        try:
+            self._run_tasks(max_tasks, duration)
+        finally:
+            # Avisa a ControlThread de que puede despachar otra vez
+            self._queue.dispatch_done()
+
+    def _run_tasks(self, max_tasks: int, duration: float):
+        start_time = self._clock.time()
         tasks_executed = 0
 
-        if self._action.vars.app.wait is not None:
-            return 
         if self._action.vars.tqueue.running_tasks:
             return
 
         self._action.vars.tqueue.running_tasks = True
-        
-        while True:
-            if max_tasks > 0 and \
-                tasks_executed >= max_tasks:
-                break
-            if duration > 0 and \
-                (time.time() - start_time) >= duration:
-                break
-
-            task_packet = self._queue.get()
-            if task_packet:
-                task_type = task_packet.task_type
-                handler = self.task_functions.get(task_type)
-
-                if handler:
-                    handler(*task_packet.args, **task_packet.kwargs)
+        try:
+            while True:
+                if max_tasks > 0 and \
+                    tasks_executed >= max_tasks:
+                    break
+                if duration > 0 and \
+                    (self._clock.time() - start_time) >= duration:
+                    break
+
+                task_packet = self._queue.get()
+                if task_packet:
+                    metrics.queue_depth(self._queue.len())
+                    task_type = task_packet.task_type
+                    handler = task_packet.handler or self.task_functions.get(task_type)
+
+                    if handler and task_type in self.gui_tasks:
+                        self._run_gui(handler, task_packet)
+                    elif handler:
+                        self._queue.hold(task_packet.sequence)
+                        self._pool.submit(self._run_blocking, handler, task_packet)
+                    else:
+                        print(f"No handler defined for task type: {task_type}, se descarta")
+
+                    tasks_executed += 1
                 else:
-                    raise Exception(f"No handler defined for task"
-                                    f" type: {task_type}")
+                    break
+        finally:
+            # Si no se suelta, ningún despacho posterior volvería a ejecutar nada
+            self._action.vars.tqueue.running_tasks = False
+
+    def _run_packet(self, handler: TaskFunction, task_packet: TaskPacket):
+        name = task_name(task_packet.task_type)
+        started_at = self._clock.time()
+        metrics.task_started(name, task_packet.pushed_at, started_at)
+        error: Optional[str] = None
+        result: Any = None
+        try:
+            result = self.call_handler(handler, task_packet)
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            finished_at = self._clock.time()
+            failed = error is not None
+            metrics.task_finished(name, started_at, finished_at, failed)
+            tracer.task(task_packet.sequence, name, task_packet.pushed_at,
+                        started_at, finished_at, failed)
+            recorder.run(task_packet, started_at, finished_at, error, result)
+            if task_packet.macro is not None:
+                task_packet.macro.step_done(finished_at)
+
+    def call_handler(self, handler: TaskFunction, task_packet: TaskPacket) -> Any:
+        """
+        Runs the handler with `task_packet` as the current task of this
+        thread, which is what delay_current() (Task.App.Wait) delays.
+        """
+        self._local.current = task_packet
+        try:
+            return handler(*task_packet.args, **task_packet.kwargs)
+        finally:
+            self._local.current = None
 
-                tasks_executed += 1
+    def _run_gui(self, handler: TaskFunction, task_packet: TaskPacket):
+        # Igual que _run_blocking: una excepción en un slot de Qt tumbaría la app
+        try:
+            self._run_packet(handler, task_packet)
+        except Exception as e:
+            print(f"Error en la tarea {task_packet}: {e}")
 
-                # If we have to wait we can't rush all the tasks!
-                if task_type == Task.App.Wait:
-                    break
-            else:
-                break
-        self._action.vars.tqueue.running_tasks = False 
+    def _run_blocking(self, handler: TaskFunction, task_packet: TaskPacket):
+        try:
+            self._run_packet(handler, task_packet)
+        except Exception as e:
+            print(f"Error en la tarea {task_packet}: {e}")
+        finally:
+            self._queue.release(task_packet.sequence)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
     def get(self):
         return self._queue.get()
 
-    def push(self, task_type: TaskType, args: Tuple[Any, ...] = (), kwargs: Dict[str, Any] = {}):
+    def push(self, task_type: TaskType, args: Tuple[Any, ...] = (),
+             kwargs: Optional[Dict[str, Any]] = None,
+             sequence: int = TaskQueue.DEFAULT_SEQUENCE,
+             priority: TaskPriority = TaskPriority.Normal):
         task_packet = TaskPacket(task_type, args, kwargs)
-        self._queue.push(task_packet)
+        self._queue.push(task_packet, sequence, priority)
+        recorder.push((task_packet,), sequence, priority)
+
+    def push_packets(self, task_packets: List[TaskPacket],
+                     sequence: int = TaskQueue.DEFAULT_SEQUENCE,
+                     priority: TaskPriority = TaskPriority.Normal):
+        self._queue.push_many(task_packets, sequence, priority)
+        recorder.push(task_packets, sequence, priority)
+
+    def sequence(self, name: Optional[str] = None) -> int:
+        """
+        New sequence id. Tasks pushed with it run in order and a Task.App.Wait
+        inside only delays them, not the rest of the queue.
+
+        `name` labels the user action in the traces (src/trace.py), starting
+        its clock now.
+        """
+        seq = self._queue.new_sequence()
+        if name is not None:
+            tracer.begin(seq, name)
+            recorder.sequence(seq, name)
+        return seq
+
+    def delay_current(self, seconds: float):
+        sequence = TaskQueue.DEFAULT_SEQUENCE
+        current: Optional[TaskPacket] = getattr(self._local, "current", None)
+        if current is not None:
+            sequence = current.sequence
+        self._queue.delay(sequence, seconds)
+
+    def cancel(self, sequence: int) -> int:
+        """
+        Drops what is left of a sequence. Returns the number of dropped tasks.
+        """
+        return self._queue.cancel(sequence)
+
+    def pending(self, sequence: int) -> bool:
+        return self._queue.pending(sequence)
     
     def len(self):
         return self._queue.len()
@@ -368,6 +611,11 @@ class Action():
         self.app = AppAction(app, stop_function, self)
         self.tar = TargetAction(self)
         self.thandler = TaskHandler(self.vars.tqueue, self)
+        self.macros = MacroLibrary(self)
+
+        self.wm.subscribe(on_removed=self.tar.on_window_removed)
+        if not self.sys_kb.grabs_hotkeys():
+            self.wm.active.subscribe(self.app.resync_modifiers)
 
     
 
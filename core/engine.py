@@ -0,0 +1,198 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+from src.shared import Task, TaskPacket, TaskType
+from src.metrics import metrics, task_name
+from src.trace import tracer
+from core.action import keyboard_switch_command, report_keyboard_switch
+from core.invoker import GuiInvoker
+from core.replay import recorder
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    from core.action import Action
+
+
+AsyncTaskFunction = Callable[..., Awaitable[None]]
+
+
+class AsyncTaskEngine:
+    """
+    asyncio replacement for ControlThread + WorkingThread.
+
+    The loop runs on its own thread (EngineThread) next to the Qt loop; widgets
+    are still only touched on the GUI thread through GuiInvoker. It consumes
+    the same TaskQueue, so sequences, priorities and cancel() behave as with
+    the threaded engine, but each sequence is an asyncio task:
+
+        - coroutine handlers (async_functions) run on the loop:
+          fcitx5-remote is an asyncio subprocess,
+        - inline_tasks (Wait) run on the loop with the same AppAction
+          handler as the threaded engine: it only delays the sequence,
+        - GUI tasks are awaited on the GUI thread,
+        - the remaining sync handlers run on the executor.
+
+    A sequence is held in the queue while one of its tasks runs, so its next
+    task starts exactly when the previous one (or its Wait) finishes.
+    """
+    WORKERS = 4
+    TARGET_CHECK_INTERVAL = 1.0
+
+    def __init__(self, action: "Action"):
+        self._action = action
+        self._queue = action.vars.tqueue
+        self._gui = GuiInvoker()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._running: Set[asyncio.Task] = set()
+        self.async_functions: Dict[TaskType, AsyncTaskFunction] = {
+            Task.App.SwitchToKeyboard: self.switch_to_keyboard,
+        }
+        self.inline_tasks: Set[TaskType] = {Task.App.Wait}
+
+    # Handlers asíncronos
+
+    async def switch_to_keyboard(self, keyboard_name: str) -> bool:
+        process = await asyncio.create_subprocess_exec(
+            *keyboard_switch_command(keyboard_name),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        return report_keyboard_switch(keyboard_name, process.returncode, stdout, stderr)
+
+    # Ciclo de vida
+
+    def run(self):
+        """
+        Blocks running the loop until stop() is called.
+        """
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(max_workers=self.WORKERS, thread_name_prefix="engine")
+        loop.set_default_executor(executor)
+        self._loop = loop
+        try:
+            loop.run_until_complete(self._main())
+        finally:
+            # Sin esperar: un worker puede estar bloqueado en el hilo de Qt,
+            # que a su vez está esperando a que termine este hilo
+            executor.shutdown(wait=False, cancel_futures=True)
+            loop.close()
+            self._loop = None
+
+    def stop(self):
+        self._stopping = True
+        self._gui.shutdown()
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _wake_threadsafe(self):
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    def _should_stop(self) -> bool:
+        return self._stopping or self._action.app.stopping()
+
+    async def _main(self):
+        self._wakeup = asyncio.Event()
+        self._queue.add_waker(self._wake_threadsafe)
+        watcher = asyncio.create_task(self._watch_target())
+        try:
+            await self._dispatch()
+        finally:
+            self._queue.remove_waker(self._wake_threadsafe)
+            watcher.cancel()
+            for task in list(self._running):
+                task.cancel()
+            await asyncio.gather(watcher, *self._running, return_exceptions=True)
+
+    async def _dispatch(self):
+        # Mismo criterio que ControlThread: solo se despierta cuando hay algo listo
+        while not self._should_stop():
+            self._wakeup.clear()
+            packet = self._queue.get()
+            if packet is not None:
+                metrics.queue_depth(self._queue.len())
+                self._start(packet)
+                continue
+
+            timeout = self._queue.next_ready_in()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        # Exit llega con app.stopping() ya a True. Se lanza en el hilo de Qt
+        # sin esperarlo, porque Main.stop() espera a que este hilo termine
+        exit_handler = self._action.thandler.task_functions[Task.App.Exit]
+        packet = self._queue.get()
+        while packet is not None:
+            if packet.task_type == Task.App.Exit:
+                self._gui.submit(exit_handler, *packet.args, **packet.kwargs)
+            packet = self._queue.get()
+
+    def _start(self, packet: TaskPacket):
+        self._queue.hold(packet.sequence)
+        task = asyncio.create_task(self._run_sequence_step(packet))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_sequence_step(self, packet: TaskPacket):
+        name = task_name(packet.task_type)
+        started_at = self._queue.clock.time()
+        metrics.task_started(name, packet.pushed_at, started_at)
+        error: Optional[str] = None
+        result: Any = None
+        try:
+            result = await self._run_packet(packet)
+        except asyncio.CancelledError:
+            error = "cancelled"
+            raise
+        except Exception as e:
+            error = repr(e)
+            print(f"Error en la tarea {packet}: {e}")
+        finally:
+            finished_at = self._queue.clock.time()
+            failed = error is not None
+            recorder.run(packet, started_at, finished_at, error, result)
+            metrics.task_finished(name, started_at, finished_at, failed)
+            tracer.task(packet.sequence, name, packet.pushed_at,
+                        started_at, finished_at, failed)
+            if packet.macro is not None:
+                packet.macro.step_done(finished_at)
+            self._queue.release(packet.sequence)
+
+    async def _run_packet(self, packet: TaskPacket) -> Any:
+        task_type = packet.task_type
+        coroutine = self.async_functions.get(task_type)
+        if coroutine is not None:
+            return await coroutine(*packet.args, **packet.kwargs)
+
+        thandler = self._action.thandler
+        handler = packet.handler or thandler.task_functions.get(task_type)
+        if handler is None:
+            raise Exception(f"No handler defined for task type: {task_type}")
+
+        # Mismos handlers que TaskHandler, con el paquete como tarea actual
+        call = functools.partial(thandler.call_handler, handler, packet)
+        if task_type in self.inline_tasks:
+            return call()
+        if task_type in thandler.gui_tasks:
+            return await asyncio.wrap_future(self._gui.submit(call))
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    async def _watch_target(self):
+        # Equivalente a WorkingThread: comprobar que el target sigue vivo
+        loop = asyncio.get_running_loop()
+        while not self._should_stop():
+            await loop.run_in_executor(None, self._action.tar.locate_or_stop_task)
+            await asyncio.sleep(self.TARGET_CHECK_INTERVAL)
@@ -1,8 +1,9 @@
 from PyQt6.QtCore import QObject, QEvent, Qt
-from src.shared import ExitReason, Task 
+from src.shared import ExitReason, Task, TaskPriority
 from src.sys_keyboard import SystemKeyboard
-from pynput import keyboard
+from src.hotkey import HotkeyTable, key_id
 from abc import ABC, abstractmethod
+from typing import Callable, Dict
 from core.action import Action
 from core.ffchat import FFChat
 
@@ -23,17 +24,6 @@ class FFEvent(QObject):
         super().__init__(ffchat)
         self._action = action
 
-    def _preparar_mensaje(self):
-        self._action.thandler.push(Task.App.SaveClipboard)
-        self._action.thandler.push(Task.FF.CopyInput)
-        self._action.thandler.push(Task.Tar.Focus)
-        self._action.thandler.push(Task.FF.Hide)
-
-    def _limpiar(self):
-        self._action.thandler.push(Task.FF.ClearInput)
-        self._action.thandler.push(Task.App.RestoreClipboard)
-        self._action.thandler.push(Task.App.SwitchToKeyboard,("keyboard-es",))
-
     def eventFilter(self, obj, event):
         if event.type() == QEvent.Type.KeyPress:
             key_event = event  # No es necesario convertir a QKeyEvent en PyQt6
@@ -43,13 +33,9 @@ class FFEvent(QObject):
                 # self.envio_simple()
                 pass
             elif key_event.key() == Qt.Key.Key_Return:
-                self._preparar_mensaje() 
-                self._action.thandler.push(Task.App.Wait, (0.1,)) 
-                self._action.thandler.push(Task.App.SendKeystroke, 
-                                           ([keyboard.Key.ctrl_l, keyboard.KeyCode.from_char('v')],))
-                self._action.thandler.push(Task.App.Wait, (0.15,)) 
-                self._limpiar()
-                self._action.thandler.push(Task.App.SendKeystroke, ([keyboard.Key.enter],))
+                # Todo el envío va en una secuencia: sus Wait no frenan al resto
+                # y Ctrl+D puede cancelar lo que quede pendiente
+                self._action.vars.ff.send_sequence = self._action.macros.run(self._action.macros.send)
                 
         return super().eventFilter(obj, event)
 
@@ -78,76 +64,92 @@ class SystemKeyboardHandler(EventHandler):
     def __init__(self, sys_kb: SystemKeyboard, action: Action):
         super().__init__(action)
         self._sys_kb = sys_kb
-        self._pressed_keys = self._sys_kb.pressed_keys
-        self._sys_kb.assign_functions(self._keydown, self._keyup)
+        self._hotkeys = HotkeyTable(action.vars.arg.hotkeys)
+        self._actions: Dict[str, Callable[[], None]] = {
+            "open": self._open,
+            "cancel": self._cancel,
+            "edit-and-escape": self._edit_and_escape,
+            "clear": self._clear,
+            "focus-ffchat": self._focus_ffchat,
+            "restore": self._restore,
+            "exit": self._exit,
+        }
+        unknown = self._hotkeys.actions() - self._actions.keys()
+        if unknown:
+            raise ValueError(f"Acciones de hotkey desconocidas: {', '.join(sorted(unknown))}")
+        if self._sys_kb.grabs_hotkeys():
+            # X solo nos despierta con las combinaciones asignadas
+            self._sys_kb.assign_hotkeys(self._hotkeys, self._dispatch)
+        else:
+            self._sys_kb.assign_functions(self._keydown, self._keyup)
 
     def _keydown(self, key):
-        if keyboard.Key.ctrl_l in self._pressed_keys and key == keyboard.Key.enter:
-            if self._action.tar.focused():
-                self._action.thandler.push(Task.App.Wait, (0.1, ))
-                self._action.thandler.push(
-                    Task.FF.Show,
-                    (),
-                    {}
-                )
-                self._action.thandler.push(
-                    Task.FF.Focus,
-                        (),
-                        {}
-                    )
-                self._action.thandler.push(
-                    Task.App.SwitchToKeyboard,
-                    ("mozc",),
-                    {}
-                )
-            pass
-        elif key == keyboard.Key.esc:
-            pass 
-        elif keyboard.Key.ctrl_l in self._pressed_keys and key == keyboard.Key.space:
-            pass
-        elif keyboard.Key.ctrl_l in self._pressed_keys and key == keyboard.KeyCode.from_char('d'):
-            if self._action.ff.is_visible() and self._action.ff.focused():
-                self._action.thandler.push(
-                    Task.FF.Hide,
-                    (),
-                    {}
-                )
-                self._action.thandler.push(Task.FF.ClearInput)
-                self._action.thandler.push(Task.App.SwitchToKeyboard,("keyboard-es",))
-                self._action.thandler.push(Task.App.Wait, (0.1, ))
-                self._action.thandler.push(Task.App.SendKeystroke, ([keyboard.Key.esc],))
-        elif keyboard.Key.ctrl_l in self._pressed_keys and key == keyboard.KeyCode.from_char('e'):
-            if self._action.ff.is_visible() and self._action.ff.focused():
-                self._action.thandler.push(
-                    Task.FF.Hide,
-                    (),
-                    {}
-                )
-                self._action.thandler.push(Task.App.SwitchToKeyboard,("keyboard-es",))
-                self._action.thandler.push(Task.App.Wait, (0.1, ))
-                self._action.thandler.push(Task.App.SendKeystroke, ([keyboard.Key.esc],))
-        elif keyboard.Key.ctrl_l in self._pressed_keys and key == keyboard.KeyCode.from_char('l'):
-            if self._action.ff.is_visible() and self._action.ff.focused():
-                self._action.thandler.push(
-                    Task.FF.ClearInput,
-                    (),
-                    {}
-                )
-        elif keyboard.Key.ctrl_l in self._pressed_keys and key == keyboard.KeyCode.from_char('f'):
-            if self._action.tar.focused() and self._action.ff.is_visible():
-                self._action.thandler.push(Task.FF.Focus)
-                
-        elif keyboard.Key.ctrl_l in self._pressed_keys and key == keyboard.KeyCode.from_char('r'):
-            if self._action.ff.is_visible() and self._action.ff.focused():
-                self._action.thandler.push(Task.FF.Restore, (True,))
-        elif keyboard.Key.shift in self._pressed_keys and key == keyboard.Key.f1:
-            pass
-        elif keyboard.Key.shift in self._pressed_keys and key == keyboard.Key.f8:
-            self._action.app.create_stop_task(
-                ExitReason.ExitKeyPress, 
-                "Thanks you for using my software",
-                False
+        # Se llama en el hilo de pynput con cada tecla: lo no asignado sale ya
+        kid = key_id(key)
+        if kid not in self._hotkeys.keys:
+            return
+        name = self._hotkeys.resolve(self._sys_kb.modifiers(), kid)
+        if name is not None:
+            self._dispatch(name)
+
+    def _dispatch(self, name: str):
+        self._actions[name]()
+
+    # Acciones
+
+    def _open(self):
+        if self._action.tar.focused():
+            self._action.macros.run("open")
+
+    def _cancel(self):
+        if self._cancel_send():
+            return
+        if self._action.ff.is_visible() and self._action.ff.focused():
+            self._action.macros.run("cancel")
+
+    def _edit_and_escape(self):
+        if self._action.ff.is_visible() and self._action.ff.focused():
+            self._action.macros.run("edit-and-escape")
+
+    def _clear(self):
+        thandler = self._action.thandler
+        if self._action.ff.is_visible() and self._action.ff.focused():
+            thandler.push(Task.FF.ClearInput, sequence=thandler.sequence("clear"),
+                          priority=TaskPriority.High)
+
+    def _focus_ffchat(self):
+        thandler = self._action.thandler
+        if self._action.tar.focused() and self._action.ff.is_visible():
+            thandler.push(Task.FF.Focus, sequence=thandler.sequence("focus-ffchat"),
+                          priority=TaskPriority.High)
+
+    def _restore(self):
+        thandler = self._action.thandler
+        if self._action.ff.is_visible() and self._action.ff.focused():
+            thandler.push(Task.FF.Restore, (True,), sequence=thandler.sequence("restore"))
+
+    def _exit(self):
+        self._action.app.create_stop_task(
+            ExitReason.ExitKeyPress, 
+            "Thanks you for using my software",
+            False
         )
+
+    def _cancel_send(self) -> bool:
+        """
+        Aborta un envío en curso. Devuelve True si había algo que cancelar.
+        """
+        ffvars = self._action.vars.ff
+        seq = ffvars.send_sequence
+        if seq is None or not self._action.thandler.pending(seq):
+            return False
+
+        # Lo que el envío habría dejado a medias, detrás de la tarea en curso
+        macros = self._action.macros
+        dropped = macros.cancel(seq, cleanup=macros.cancel_send)
+        ffvars.send_sequence = None
+        print(f"Envío cancelado, {dropped} tareas descartadas")
+        return True
           
     def _keyup(self, key):
         pass
@@ -3,6 +3,7 @@ from PyQt6.QtGui import QFont, QPalette, QColor, QPainter
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QHBoxLayout, QSpacerItem, QSizePolicy, QGraphicsOpacityEffect, QApplication, QLabel
 from typing import Tuple, Optional, Union
 import sys, os
+import threading
 from src.color_converter import ColorConverter, OutputColor
 
 os.environ['QT_IM_MODULE'] = 'fcitx5'
@@ -64,6 +65,10 @@ class TranslucentWidget(QWidget):
 class FFChat(TranslucentWidget):
     def __init__(self):
         super().__init__((10,10,10,0.70), 1.0)
+        self._native_id: Optional[int] = None
+        # Se puede esperar desde otros hilos (WaitCondition.FFChatHidden)
+        self._hidden = threading.Event()
+        self._hidden.set()
         self.initUI()
 
     def initUI(self):
@@ -132,6 +137,27 @@ class FFChat(TranslucentWidget):
         if pos is not None:
             self.move(*pos)
 
+    def native_id(self) -> Optional[int]:
+        """
+        X id of our own window, known once it has been mapped.
+        """
+        return self._native_id
+
+    def wait_hidden(self, timeout: float) -> bool:
+        return self._hidden.wait(timeout)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._hidden.clear()
+
+        # El id nativo no cambia mientras viva la ventana
+        if self._native_id is None:
+            self._native_id = int(self.winId())
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self._hidden.set()
+
     def resizeEvent(self, event):
         super().resizeEvent(event)
 
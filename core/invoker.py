@@ -0,0 +1,84 @@
+from PyQt6.QtCore import QObject, QThread, Qt, pyqtSignal
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Callable, Set
+import threading
+
+
+class GuiInvoker(QObject):
+    """
+    Runs callables on the GUI thread. Must be created on the GUI thread.
+
+    From any other thread call() queues the callable through a Qt signal and
+    blocks until it has run; on the GUI thread it just calls it.
+
+    Once the Qt loop is going away, shutdown() fails every call still queued
+    so no worker stays blocked on a slot that will never be delivered.
+    """
+    _invoke = pyqtSignal(object)
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._pending: Set[Future] = set()
+        self._closed = False
+        self._invoke.connect(self._run, Qt.ConnectionType.QueuedConnection)
+
+    def in_gui_thread(self) -> bool:
+        return QThread.currentThread() == self.thread()
+
+    def call(self, function: Callable[..., Any], *args, **kwargs) -> Any:
+        if self.in_gui_thread():
+            return function(*args, **kwargs)
+        return self.submit(function, *args, **kwargs).result()
+
+    def submit(self, function: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Queues the call without waiting. Useful from an asyncio loop:
+            await asyncio.wrap_future(invoker.submit(widget.hide))
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                future.set_exception(RuntimeError("GuiInvoker cerrado: el bucle de Qt ha terminado"))
+                return future
+            self._pending.add(future)
+        self._invoke.emit((partial(function, *args, **kwargs), future))
+        return future
+
+    def shutdown(self) -> None:
+        """
+        Fails the calls not run yet and every later one with RuntimeError.
+        """
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, set()
+        # Fuera de _pending ya no pasan a running en _run: solo quedan las que
+        # se están ejecutando ahora mismo o siguen en la cola de Qt
+        for future in pending:
+            if future.running() or future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError("GuiInvoker cerrado antes de ejecutar la llamada"))
+
+    def _run(self, job):
+        function, future = job
+        with self._lock:
+            # Ya fallada por shutdown() o cancelada (wrap_future de un bucle asyncio que se cierra)
+            if future not in self._pending:
+                return
+            if not future.set_running_or_notify_cancel():
+                self._pending.discard(future)
+                return
+
+        try:
+            result, error = function(), None
+        except Exception as e:
+            result, error = None, e
+
+        with self._lock:
+            if future not in self._pending:
+                return
+            self._pending.discard(future)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
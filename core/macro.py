@@ -0,0 +1,235 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from pynput import keyboard
+import threading
+from src.shared import Task, TaskPacket, TaskPriority, TaskType, WaitCondition
+from src.clock import Clock
+from src.metrics import metrics
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    from core.action import Action
+
+
+Step = Tuple[TaskType, Tuple[Any, ...]]
+
+EMPTY_KWARGS: Dict[str, Any] = {}
+
+
+class Macro:
+    """
+    Named task sequence built once: args are fixed tuples and handlers are
+    resolved when the library is compiled, not looked up on every step.
+
+    `budget` is how long a run is expected to take from push to its last
+    task; runs over it are counted in the metrics.
+    """
+    def __init__(self, name: str, steps: Sequence[Step],
+                 priority: TaskPriority = TaskPriority.Normal, budget: float = 1.0):
+        self.name = name
+        self.steps = tuple(steps)
+        self.priority = priority
+        self.budget = budget
+        self._compiled: Tuple[Tuple[TaskType, Tuple[Any, ...], Any], ...] = ()
+
+    def compile(self, task_functions: Dict[TaskType, Any]) -> None:
+        compiled = []
+        for task_type, args in self.steps:
+            handler = task_functions.get(task_type)
+            if handler is None:
+                raise Exception(f"Macro {self.name}: no handler defined for task type: {task_type}")
+            compiled.append((task_type, args, handler))
+        self._compiled = tuple(compiled)
+
+    def packets(self, run: "MacroRun") -> List[TaskPacket]:
+        return [TaskPacket(task_type, args, EMPTY_KWARGS, handler, run)
+                for task_type, args, handler in self._compiled]
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __str__(self):
+        steps = ", ".join(f"{type(task_type).__name__}.{task_type.name}" for task_type, _ in self.steps)
+        return f"Macro({self.name}: {steps}, budget={self.budget}s)"
+
+
+class MacroRun:
+    """
+    One execution of a macro. Finishes when its last task has run or when
+    it is cancelled, and reports its total time once.
+    """
+    def __init__(self, macro: Macro, sequence: int, clock: Clock):
+        self.macro = macro
+        self.sequence = sequence
+        self._clock = clock
+        self.started_at = clock.time()
+        self.finished_at: Optional[float] = None
+        self._remaining = len(macro)
+        self._lock = threading.Lock()
+        self._done = False
+
+    def step_done(self, finished_at: float) -> None:
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining > 0 or self._done:
+                return
+            self._done = True
+            self.finished_at = finished_at
+        metrics.macro_finished(self.macro.name, finished_at - self.started_at,
+                               self.macro.budget)
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+        metrics.macro_finished(self.macro.name, self._clock.time() - self.started_at,
+                               self.macro.budget, cancelled=True)
+
+    def done(self) -> bool:
+        with self._lock:
+            return self._done
+
+
+class MacroLibrary:
+    """
+    The send and hotkey flows as macros. A run is pushed as a whole into its
+    own sequence (TaskQueue.push_many) and cancelled as a whole.
+    """
+    # send_mode -> (macro de envío, macro que limpia un envío cancelado)
+    SEND_MODES: Dict[str, Tuple[str, str]] = {
+        "clipboard": ("send", "cancel-send"),
+        "xtest": ("send-xtest", "cancel-send-xtest"),
+    }
+
+    def __init__(self, action: "Action"):
+        self._action = action
+        self._macros: Dict[str, Macro] = {}
+        self._runs: Dict[int, MacroRun] = {}
+        self._lock = threading.Lock()
+
+        send_mode = action.vars.arg.send_mode
+        if send_mode not in self.SEND_MODES:
+            raise ValueError(f"Unknown send mode: {send_mode}")
+        self.send, self.cancel_send = self.SEND_MODES[send_mode]
+
+        paste = ([keyboard.Key.ctrl_l, keyboard.KeyCode.from_char('v')],)
+        enter = ([keyboard.Key.enter],)
+        esc = ([keyboard.Key.esc],)
+
+        self.add(Macro("send", (
+            (Task.App.SaveClipboard, ()),
+            (Task.FF.CopyInput, ()),
+            (Task.Tar.Focus, ()),
+            (Task.FF.Hide, ()),
+            # Se pega en cuanto el portapapeles tiene nuestro texto; el foco
+            # del target ya lo confirma Tar.Focus (WindowManager.focus)
+            (Task.App.WaitFor, (WaitCondition.FFChatHidden, 0.1)),
+            (Task.App.WaitFor, (WaitCondition.ClipboardReady, 0.1)),
+            (Task.App.SendKeystroke, paste),
+            # El juego lee el portapapeles cuando procesa el Ctrl+V y eso
+            # no se puede observar: esta espera se mantiene fija
+            (Task.App.Wait, (0.15,)),
+            (Task.FF.ClearInput, ()),
+            (Task.App.RestoreClipboard, ()),
+            (Task.App.SwitchToKeyboard, ("keyboard-es",)),
+            (Task.App.SendKeystroke, enter),
+        ), budget=0.8))
+
+        # Sin portapapeles ni Ctrl+V: el texto se escribe con XTest. El teclado
+        # se cambia antes de escribir para que mozc no convierta las teclas
+        self.add(Macro("send-xtest", (
+            (Task.Tar.Focus, ()),
+            (Task.FF.Hide, ()),
+            (Task.App.WaitFor, (WaitCondition.FFChatHidden, 0.1)),
+            (Task.App.SwitchToKeyboard, ("keyboard-es",)),
+            (Task.FF.TypeInput, ()),
+            (Task.FF.ClearInput, ()),
+            (Task.App.SendKeystroke, enter),
+        ), budget=0.5))
+
+        self.add(Macro("open", (
+            (Task.App.Wait, (0.1,)),
+            (Task.FF.Show, ()),
+            (Task.FF.Focus, ()),
+            (Task.App.SwitchToKeyboard, ("mozc",)),
+        ), priority=TaskPriority.High, budget=0.4))
+
+        self.add(Macro("cancel", (
+            (Task.FF.Hide, ()),
+            (Task.FF.ClearInput, ()),
+            (Task.App.SwitchToKeyboard, ("keyboard-es",)),
+            (Task.App.WaitFor, (WaitCondition.TargetFocused, 0.1)),
+            (Task.App.SendKeystroke, esc),
+        ), priority=TaskPriority.High, budget=0.4))
+
+        self.add(Macro("edit-and-escape", (
+            (Task.FF.Hide, ()),
+            (Task.App.SwitchToKeyboard, ("keyboard-es",)),
+            (Task.App.WaitFor, (WaitCondition.TargetFocused, 0.1)),
+            (Task.App.SendKeystroke, esc),
+        ), priority=TaskPriority.High, budget=0.4))
+
+        # Lo que un envío cancelado habría dejado a medias
+        self.add(Macro("cancel-send", (
+            (Task.App.RestoreClipboard, ()),
+            (Task.App.SwitchToKeyboard, ("keyboard-es",)),
+        ), priority=TaskPriority.High, budget=0.2))
+
+        self.add(Macro("cancel-send-xtest", (
+            (Task.App.SwitchToKeyboard, ("keyboard-es",)),
+        ), priority=TaskPriority.High, budget=0.2))
+
+    def add(self, macro: Macro) -> None:
+        macro.compile(self._action.thandler.task_functions)
+        self._macros[macro.name] = macro
+
+    def get(self, name: str) -> Macro:
+        return self._macros[name]
+
+    def run(self, name: str, sequence: Optional[int] = None) -> int:
+        """
+        Pushes a run of `name` in a new sequence, or at the end of `sequence`,
+        and returns it.
+        """
+        macro = self._macros[name]
+        thandler = self._action.thandler
+        seq = thandler.sequence(name) if sequence is None else sequence
+        run = MacroRun(macro, seq, self._action.vars.clock)
+        with self._lock:
+            self._forget_done()
+            self._runs[seq] = run
+        thandler.push_packets(macro.packets(run), sequence=seq, priority=macro.priority)
+        return seq
+
+    def run_for(self, seq: int) -> Optional[MacroRun]:
+        """
+        The run pushed in `seq`, while it has not been forgotten (the next
+        run() forgets the finished ones).
+        """
+        with self._lock:
+            return self._runs.get(seq)
+
+    def cancel(self, seq: int, cleanup: Optional[str] = None) -> int:
+        """
+        Drops everything left of the run in `seq` at once. Returns the number
+        of dropped tasks.
+
+        `cleanup` is run in `seq` itself, so it starts only after the task of
+        the cancelled run that may still be executing.
+        """
+        dropped = self._action.thandler.cancel(seq)
+        with self._lock:
+            run = self._runs.pop(seq, None)
+        if run is not None:
+            run.cancel()
+        if cleanup is not None:
+            self.run(cleanup, sequence=seq)
+        return dropped
+
+    def _forget_done(self) -> None:
+        for seq in [seq for seq, run in self._runs.items() if run.done()]:
+            del self._runs[seq]
+
+    def __str__(self):
+        return "\n".join(str(macro) for macro in self._macros.values())
@@ -0,0 +1,240 @@
+from typing import Any, Dict, List, Optional, Sequence
+from enum import Enum
+import json
+import sys
+import threading
+from pynput import keyboard
+from src.clock import Clock, system_clock
+from src.shared import ExitReason, Task, TaskPacket, TaskPriority, TaskType, WaitCondition
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    from core.action import TaskHandler
+
+"""
+Record and replay of the TaskPacket stream.
+
+The recording is JSON lines, one event per line, `t` in seconds since the
+recorder started:
+    {"t": 0.0, "ev": "sequence", "seq": 3, "name": "send"}
+    {"t": 0.0, "ev": "push", "seq": 3, "prio": 20, "tasks": [{"task": "App.SaveClipboard", "args": [], "kwargs": {}}, ...]}
+    {"t": 0.01, "ev": "run", "seq": 3, "task": "App.SaveClipboard", "wait": 0.002, "run": 0.004, "failed": false, "result": null}
+
+`result` is what the handler returned (WaitFor's bool, for instance),
+encoded like the args; anything else is stored as its repr.
+
+Replaying re-pushes the same stream (new sequence ids, same grouping,
+priorities and timing) into a TaskHandler, whatever WM backend it uses.
+"""
+
+
+# Tipos que aparecen en los args de las tareas
+ARG_ENUMS = {cls.__name__: cls for cls in (WaitCondition, ExitReason)}
+
+
+def task_from_name(name: str) -> TaskType:
+    group, member = name.split(".")
+    return getattr(getattr(Task, group), member)
+
+
+def task_to_name(task_type: TaskType) -> str:
+    return f"{type(task_type).__name__}.{task_type.name}"
+
+
+def encode_arg(value: Any) -> Any:
+    if isinstance(value, keyboard.Key):
+        return {"key": value.name}
+    if isinstance(value, keyboard.KeyCode):
+        return {"char": value.char} if value.char is not None else {"vk": value.vk}
+    if isinstance(value, Enum):
+        return {"enum": f"{type(value).__name__}.{value.name}"}
+    if isinstance(value, (list, tuple)):
+        return [encode_arg(item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode_arg(item) for key, item in value.items()}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return {"repr": repr(value)}
+
+
+def decode_arg(value: Any) -> Any:
+    if isinstance(value, list):
+        return [decode_arg(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "key" in value:
+        return keyboard.Key[value["key"]]
+    if "char" in value:
+        return keyboard.KeyCode.from_char(value["char"])
+    if "vk" in value:
+        return keyboard.KeyCode.from_vk(value["vk"])
+    if "enum" in value:
+        enum_name, member = value["enum"].split(".")
+        return ARG_ENUMS[enum_name][member]
+    if "repr" in value:
+        return value["repr"]
+    return {key: decode_arg(item) for key, item in value.items()}
+
+
+class TaskRecorder:
+    def __init__(self, clock: Clock = system_clock):
+        self.enabled = False
+        # El mismo reloj que las tareas (Vars.clock)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._events: List[Dict[str, Any]] = []
+        self._start = clock.time()
+
+    def start(self) -> None:
+        with self._lock:
+            self._events.clear()
+            self._start = self.clock.time()
+        self.enabled = True
+
+    def sequence(self, seq: int, name: str) -> None:
+        if self.enabled:
+            self._add({"ev": "sequence", "seq": seq, "name": name})
+
+    def push(self, task_packets: Sequence[TaskPacket], seq: int, priority: TaskPriority) -> None:
+        if not self.enabled:
+            return
+        tasks = [{
+            "task": task_to_name(packet.task_type),
+            "args": encode_arg(list(packet.args)),
+            "kwargs": encode_arg(packet.kwargs),
+        } for packet in task_packets]
+        self._add({"ev": "push", "seq": seq, "prio": int(priority), "tasks": tasks})
+
+    def run(self, task_packet: TaskPacket, started_at: float, finished_at: float,
+            error: Optional[str] = None, result: Any = None) -> None:
+        if not self.enabled:
+            return
+        self._add({
+            "ev": "run",
+            "seq": task_packet.sequence,
+            "task": task_to_name(task_packet.task_type),
+            "wait": round(started_at - task_packet.pushed_at, 6),
+            "run": round(finished_at - started_at, 6),
+            "failed": error is not None,
+            "error": error,
+            "result": encode_arg(result),
+        })
+
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._events)
+
+    def save(self, path: str) -> None:
+        events = self.events()
+        with open(path, "w") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        print(f"Grabación guardada en {path} ({len(events)} eventos)")
+
+    def _add(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            event["t"] = round(self.clock.time() - self._start, 6)
+            self._events.append(event)
+
+
+class TaskReplayer:
+    """
+    Pushes a recorded stream again. `speed` scales the original timing
+    (2.0 = twice as fast); None pushes everything as fast as possible.
+    """
+    def __init__(self, events: List[Dict[str, Any]]):
+        self.events = events
+
+    @classmethod
+    def load(cls, path: str) -> "TaskReplayer":
+        with open(path) as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+    def pushes(self) -> List[Dict[str, Any]]:
+        return [event for event in self.events if event["ev"] == "push"]
+
+    def replay(self, thandler: "TaskHandler", speed: Optional[float] = 1.0,
+               stop: Optional[threading.Event] = None,
+               skip: Sequence[str] = ("App.Exit",),
+               clock: Clock = system_clock) -> int:
+        """
+        Returns the number of pushed tasks. Tasks named in `skip` are left
+        out; by default the Exit that ended the recorded session. The
+        original timing is reproduced on `clock`.
+        """
+        names = {event["seq"]: event["name"] for event in self.events if event["ev"] == "sequence"}
+        sequences: Dict[int, int] = {0: 0}
+        start = clock.monotonic()
+        pushed = 0
+
+        for event in self.pushes():
+            if speed is not None:
+                delay = start + event["t"] / speed - clock.monotonic()
+                if delay > 0 and stop is not None:
+                    if clock.wait_event(stop, delay):
+                        break
+                elif delay > 0:
+                    clock.sleep(delay)
+            elif stop is not None and stop.is_set():
+                break
+
+            # Las secuencias se renumeran; las tareas de una misma secuencia
+            # grabada siguen juntas
+            seq = sequences.get(event["seq"])
+            if seq is None:
+                seq = sequences[event["seq"]] = thandler.sequence(names.get(event["seq"]))
+
+            packets = [TaskPacket(task_from_name(task["task"]),
+                                  tuple(decode_arg(task["args"])),
+                                  decode_arg(task["kwargs"]))
+                       for task in event["tasks"] if task["task"] not in skip]
+            if not packets:
+                continue
+            thandler.push_packets(packets, sequence=seq, priority=TaskPriority(event["prio"]))
+            pushed += len(packets)
+        return pushed
+
+    def summary(self) -> str:
+        """
+        Per task type and per action timings of the recording itself.
+        """
+        names = {event["seq"]: event["name"] for event in self.events if event["ev"] == "sequence"}
+        runs = [event for event in self.events if event["ev"] == "run"]
+        pushed_at = {}
+        for event in self.pushes():
+            pushed_at.setdefault(event["seq"], event["t"])
+
+        per_task: Dict[str, List[float]] = {}
+        for run in runs:
+            per_task.setdefault(run["task"], []).append(run["wait"] + run["run"])
+
+        finished_at: Dict[int, float] = {}
+        for run in runs:
+            finished_at[run["seq"]] = max(finished_at.get(run["seq"], 0.0), run["t"])
+
+        msg = f"[ {len(self.pushes())} pushes, {len(runs)} tareas ejecutadas ]"
+        msg += "\n  Por tarea (espera + ejecución):"
+        for task, values in sorted(per_task.items()):
+            values.sort()
+            msg += f"\n    {task:<22} n={len(values):<5} media={sum(values) / len(values) * 1000:8.2f} ms"
+            msg += f"  max={values[-1] * 1000:8.2f} ms"
+
+        per_action: Dict[str, List[float]] = {}
+        for seq, start in pushed_at.items():
+            if seq in finished_at and seq in names:
+                per_action.setdefault(names[seq], []).append(finished_at[seq] - start)
+        msg += "\n  Por acción (push -> última tarea):"
+        for name, values in sorted(per_action.items()):
+            values.sort()
+            msg += f"\n    {name:<22} n={len(values):<5} media={sum(values) / len(values) * 1000:8.2f} ms"
+            msg += f"  max={values[-1] * 1000:8.2f} ms"
+        return msg
+
+
+recorder = TaskRecorder()
+
+
+if __name__ == "__main__":
+    # python -m core.replay grabacion.jsonl
+    print(TaskReplayer.load(sys.argv[1]).summary())
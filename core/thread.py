@@ -2,6 +2,7 @@ from PyQt6.QtCore import QThread, QEventLoop, pyqtSignal
 from abc import ABC, abstractmethod
 import time
 from core.action import Action
+from core.engine import AsyncTaskEngine
 
 """
 quit(): Usado para salir del QEventLoop de manera ordenada y procesar los eventos pendientes.
@@ -85,23 +86,23 @@ class ControlThread(ThreadBase):
     
     def run(self):
         action = self._action
+        tqueue = action.vars.tqueue
         app_stopping = self._action.app.stopping
         interrupted = self.isInterruptionRequested
 
-        while not interrupted() and not app_stopping():
-            wait_until = action.vars.app.wait
-            if wait_until is not None:
-                if time.time() < wait_until:
-                    continue
-                else:
-                    print(f"espera de {wait_until - time.time()} terminada")
-                    action.vars.app.wait = None
-                    continue
-
-            time.sleep(0.005)
+        def should_stop():
+            return interrupted() or app_stopping()
+
+        # Sin polling: dormimos hasta que alguna secuencia tenga una tarea lista
+        while tqueue.wait_ready(should_stop):
             self.run_tasks.emit(1,1)
         self.run_tasks.emit(0,0)
 
+    def stop(self):
+        self.requestInterruption()
+        self._action.vars.tqueue.wake()
+        self.wait()
+
 
 class ControlHandler(ThreadHandlerBase):
     def __init__(self, action: Action):
@@ -159,6 +160,73 @@ class WorkingHandler(ThreadHandlerBase):
         print(f"Working Update: {result}")
 
 
+#########################################
+
+
+class WindowEventsThread(ThreadBase):
+    def __init__(self, action: Action):
+        super().__init__(action)
+
+    def run(self):
+        wm = self._action.wm
+        interrupted = self.isInterruptionRequested
+
+        while not interrupted():
+            wm.process_events(timeout=0.5)
+        wm.stop_events()
+
+
+class WindowEventsHandler(ThreadHandlerBase):
+    def __init__(self, action: Action):
+        super().__init__(action)
+        self._th = WindowEventsThread(action)
+
+    def connect_signals(self):
+        pass
+
+    def run(self, wait=False):
+        # La sincronización inicial se hace aquí para que StartingThread
+        # ya encuentre el registro completo. Sin eventos (desactivados o el
+        # backend no los tiene) seguimos con update() y no hace falta el hilo
+        if not self._action.wm.start_events():
+            return
+        super().run(wait)
+
+    def stop(self):
+        assert self._th is not None
+        if self._th.isRunning():
+            self._th.stop()
+
+
+#########################################
+
+
+class EngineThread(ThreadBase):
+    def __init__(self, action: Action):
+        super().__init__(action)
+        self.engine = AsyncTaskEngine(action)
+
+    def run(self):
+        self.engine.run()
+
+    def stop(self):
+        self.requestInterruption()
+        self.engine.stop()
+        self.wait()
+
+
+class EngineHandler(ThreadHandlerBase):
+    """
+    Sustituye a ControlHandler y WorkingHandler con vars.arg.engine == "asyncio".
+    """
+    def __init__(self, action: Action):
+        super().__init__(action)
+        self._th = EngineThread(action)
+
+    def connect_signals(self):
+        pass
+
+
 #########################################
 #########################################
 
@@ -169,12 +237,16 @@ class ThreadManager:
         self._starting = StartingHandler(self._action)
         self._control = ControlHandler(self._action)
         self._working = WorkingHandler(self._action)
+        self._window_events = WindowEventsHandler(self._action)
+        self._engine = EngineHandler(self._action)
         self._connect_signals()
         
     def _connect_signals(self):
         self._starting.connect_signals()
         self._control.connect_signals()
         self._working.connect_signals()
+        self._window_events.connect_signals()
+        self._engine.connect_signals()
         
     def run_starting(self, wait: bool):
         self._starting.run(wait)
@@ -194,6 +266,18 @@ class ThreadManager:
     def stop_control(self):
         self._control.stop()
 
+    def run_window_events(self):
+        self._window_events.run(wait=False)
+
+    def stop_window_events(self):
+        self._window_events.stop()
+
+    def run_engine(self):
+        self._engine.run(wait=False)
+
+    def stop_engine(self):
+        self._engine.stop()
+
 
 
 
@@ -1,7 +1,9 @@
-from typing import Tuple, List, Optional
-from src.shared import ExitReason, TaskPacket
-from queue import Queue, Empty
-import copy
+from typing import Callable, Deque, Dict, Tuple, List, Optional, Sequence
+from src.shared import ExitReason, TaskPacket, TaskPriority
+from src.clock import Clock, system_clock
+from collections import deque
+import itertools
+import threading
 from typing import TYPE_CHECKING
 
 
@@ -31,10 +33,23 @@ class Args(VarsChildren):
     default_arg = {
         "tname": None,
         "tclass": None,
+        "tpid": None,
+        "trole": None,
         "size": (400, 200),
         "pos": (50,-50),
         "qtarg": [],
-        "res": (1920, 1080)
+        "res": (1920, 1080),
+        "wm_events": False,
+        "wm_backend": "bspwm",
+        "engine": "threads",
+        "metrics_file": None,
+        "trace_file": None,
+        "record_file": None,
+        "replay_file": None,
+        "replay_speed": 1.0,
+        "hotkeys": None,
+        "keyboard_backend": "pynput",
+        "send_mode": "clipboard"
     }
 
     def __init__(self, arg):
@@ -43,12 +58,40 @@ class Args(VarsChildren):
         r = self.default_arg["res"] if arg["res"] is None else arg["res"]
         tn = self.default_arg["tname"] if arg["tname"] is None else arg["tname"]
         tc = self.default_arg["tclass"] if arg["tclass"] is None else arg["tclass"]
+        we = self.default_arg["wm_events"] if arg.get("wm_events") is None else arg["wm_events"]
+        tp = self.default_arg["tpid"] if arg.get("tpid") is None else arg["tpid"]
+        tr = self.default_arg["trole"] if arg.get("trole") is None else arg["trole"]
+        wb = self.default_arg["wm_backend"] if arg.get("wm_backend") is None else arg["wm_backend"]
+        en = self.default_arg["engine"] if arg.get("engine") is None else arg["engine"]
+        mf = self.default_arg["metrics_file"] if arg.get("metrics_file") is None else arg["metrics_file"]
+        tf = self.default_arg["trace_file"] if arg.get("trace_file") is None else arg["trace_file"]
+        rf = self.default_arg["record_file"] if arg.get("record_file") is None else arg["record_file"]
+        pf = self.default_arg["replay_file"] if arg.get("replay_file") is None else arg["replay_file"]
+        # None en replay_speed significa "lo más rápido posible"
+        ps = arg.get("replay_speed", self.default_arg["replay_speed"])
+        # None = src.hotkey.DEFAULT_HOTKEYS
+        hk = self.default_arg["hotkeys"] if arg.get("hotkeys") is None else arg["hotkeys"]
+        kb = self.default_arg["keyboard_backend"] if arg.get("keyboard_backend") is None else arg["keyboard_backend"]
+        sm = self.default_arg["send_mode"] if arg.get("send_mode") is None else arg["send_mode"]
 
         self._size: Tuple[int, int] = s
         self._pos: Tuple[int, int] = p 
         self._res: Tuple[int, int] = r
         self._tname:  str = tn
         self._tclass: str = tc 
+        self._tpid: Optional[int] = tp
+        self._trole: Optional[str] = tr
+        self._wm_events: bool = we
+        self._wm_backend: str = wb
+        self._engine: str = en
+        self._metrics_file: Optional[str] = mf
+        self._trace_file: Optional[str] = tf
+        self._record_file: Optional[str] = rf
+        self._replay_file: Optional[str] = pf
+        self._replay_speed: Optional[float] = ps
+        self._hotkeys: Optional[Dict[str, str]] = hk
+        self._keyboard_backend: str = kb
+        self._send_mode: str = sm
 
     @property
     def size(self) -> Tuple[int, int]:
@@ -90,6 +133,58 @@ class Args(VarsChildren):
     def tclass(self, value: str):
         self._tclass = value
 
+    @property
+    def tpid(self) -> Optional[int]:
+        return self._tpid
+
+    @property
+    def trole(self) -> Optional[str]:
+        return self._trole
+
+    @property
+    def wm_events(self) -> bool:
+        return self._wm_events
+
+    @property
+    def wm_backend(self) -> str:
+        return self._wm_backend
+
+    @property
+    def engine(self) -> str:
+        return self._engine
+
+    @property
+    def metrics_file(self) -> Optional[str]:
+        return self._metrics_file
+
+    @property
+    def trace_file(self) -> Optional[str]:
+        return self._trace_file
+
+    @property
+    def record_file(self) -> Optional[str]:
+        return self._record_file
+
+    @property
+    def replay_file(self) -> Optional[str]:
+        return self._replay_file
+
+    @property
+    def replay_speed(self) -> Optional[float]:
+        return self._replay_speed
+
+    @property
+    def hotkeys(self) -> Optional[Dict[str, str]]:
+        return self._hotkeys
+
+    @property
+    def keyboard_backend(self) -> str:
+        return self._keyboard_backend
+
+    @property
+    def send_mode(self) -> str:
+        return self._send_mode
+
     
     def __str__(self):
         msg = ""
@@ -97,33 +192,48 @@ class Args(VarsChildren):
         msg += f"pos: {self.pos}, "
         msg += f"res: {self.res}, "
         msg += f"tname: {self._tname}, "
-        msg += f"tclass: {self._tclass}"
+        msg += f"tclass: {self._tclass}, "
+        msg += f"tpid: {self._tpid}, "
+        msg += f"trole: {self._trole}, "
+        msg += f"wm_events: {self._wm_events}, "
+        msg += f"wm_backend: {self._wm_backend}, "
+        msg += f"engine: {self._engine}, "
+        msg += f"metrics_file: {self._metrics_file}, "
+        msg += f"trace_file: {self._trace_file}, "
+        msg += f"record_file: {self._record_file}, "
+        msg += f"replay_file: {self._replay_file}, "
+        msg += f"replay_speed: {self._replay_speed}, "
+        msg += f"hotkeys: {self._hotkeys}, "
+        msg += f"keyboard_backend: {self._keyboard_backend}, "
+        msg += f"send_mode: {self._send_mode}"
         return msg
 
 
 class AppVars(VarsChildren):
     def __init__(self):
-        self._wait_until: Optional[float] = None
         self._stop_reason: Optional[ExitReason] = None
         self._stop_extra_msg: str = ""
-        self._stored_clipboard: str = ""
-
-    @property
-    def wait(self):
-        return self._wait_until
-
-    @wait.setter
-    def wait(self, value: Optional[float]):
-        self._wait_until = value 
+        self._stored_clipboard: Optional[str] = None
+        self._copied_text: Optional[str] = None
 
+    # None = no hay nada guardado pendiente de restaurar
     @property
-    def stored_clipboard(self):
+    def stored_clipboard(self) -> Optional[str]:
         return self._stored_clipboard
 
     @stored_clipboard.setter
-    def stored_clipboard(self, value: str):
+    def stored_clipboard(self, value: Optional[str]):
         self._stored_clipboard = value
 
+    # Último texto copiado de FFChat, para WaitCondition.ClipboardReady
+    @property
+    def copied_text(self) -> Optional[str]:
+        return self._copied_text
+
+    @copied_text.setter
+    def copied_text(self, value: Optional[str]):
+        self._copied_text = value
+
     def assign_stop_vars(self, reason: ExitReason = ExitReason.Unknown, extra_msg = ""):
         if not self.stopping():
             self._stop_reason = reason
@@ -142,17 +252,45 @@ class AppVars(VarsChildren):
 
 class TargetVars(VarsChildren):
     def __init__(self):
-        self._tid = Optional[str]
+        self._tid: Optional[int] = None
+        # El hilo de WindowEvents suelta el tid mientras los workers lo leen
+        self._lock = threading.Lock()
 
     @property
     def tid(self):
-        assert self._tid is not None, \
+        tid = self._tid
+        assert tid is not None, \
             "Target ID is None but tried to get it"
-        return self._tid
+        return tid
 
     @tid.setter
-    def tid(self, value: str):
-        self._tid = value
+    def tid(self, value: int):
+        with self._lock:
+            self._tid = value
+
+    def peek(self) -> Optional[int]:
+        """
+        The tid in a single read, None if there is none. Use it instead of
+        has_tid() + tid when another thread may clear it in between.
+        """
+        return self._tid
+
+    def has_tid(self) -> bool:
+        return self._tid is not None
+
+    def clear(self):
+        with self._lock:
+            self._tid = None
+
+    def clear_if(self, tid: int) -> bool:
+        """
+        Clears the tid only if it is still `tid`. Returns True if it did.
+        """
+        with self._lock:
+            if self._tid != tid:
+                return False
+            self._tid = None
+            return True
 
     def __str__(self):
         msg = ""
@@ -163,6 +301,7 @@ class FFVars(VarsChildren):
     def __init__(self, last_pos_: Tuple[int, int], last_size_: Tuple[int, int]):
         self._is_visible = False
         self._is_opened = False
+        self._send_sequence: Optional[int] = None
 
     # Métodos para obtener el valor de _is_visible
     def is_visible(self) -> bool:
@@ -172,6 +311,15 @@ class FFVars(VarsChildren):
     def set_visible(self, value: bool):
         self._is_visible = value
 
+    # Secuencia del último envío, para poder cancelarlo
+    @property
+    def send_sequence(self) -> Optional[int]:
+        return self._send_sequence
+
+    @send_sequence.setter
+    def send_sequence(self, value: Optional[int]):
+        self._send_sequence = value
+
     # Métodos para obtener el valor de _is_opened
     def is_opened(self) -> bool:
         return self._is_opened
@@ -187,10 +335,51 @@ class FFVars(VarsChildren):
         return msg
 
 
+class TaskSequence:
+    """
+    Tasks that must run in order. A Task.App.Wait only delays its own sequence.
+    """
+    def __init__(self, sequence_id: int, priority: TaskPriority):
+        self.id = sequence_id
+        self.priority = priority
+        self.packets: Deque[TaskPacket] = deque()
+        self.ready_at = 0.0
+        # Una tarea de la secuencia se está ejecutando fuera (pool)
+        self.held = False
+
+    def ready_in(self, now: float) -> Optional[float]:
+        """
+        None if empty, 0 if the head can run, otherwise seconds until it can.
+        """
+        if not self.packets or self.held:
+            return None
+        # Exit no respeta esperas
+        if self.priority == TaskPriority.Exit:
+            return 0.0
+        return max(0.0, self.ready_at - now)
+
+
 class TaskQueue(VarsChildren):
-    def __init__(self):
-        self._queue: Queue[TaskPacket] = Queue()
+    """
+    Priority scheduler over task sequences.
+
+    get() returns the head of the ready sequence with the best priority
+    (ties: first pushed). Ungrouped tasks share the default sequence 0, which
+    keeps the old FIFO behaviour between them.
+    """
+    DEFAULT_SEQUENCE = 0
+
+    def __init__(self, clock: Clock = system_clock):
+        self.clock = clock
+        self._sequences: Dict[int, TaskSequence] = {}
+        self._sequence_ids = itertools.count(self.DEFAULT_SEQUENCE + 1)
+        self._order = itertools.count()
         self._running_tasks = False
+        # Se despierta al consumidor con push(), dispatch_done() y wake()
+        self._cond = threading.Condition()
+        self._dispatched = False
+        # Consumidores que no pueden bloquearse en _cond (p.ej. un event loop)
+        self._wakers: List[Callable[[], None]] = []
     
     @property
     def running_tasks(self):
@@ -200,39 +389,215 @@ class TaskQueue(VarsChildren):
     def running_tasks(self, value: bool):
         self._running_tasks = value
 
-    def get(self) -> Optional[TaskPacket]:
-        try:
-            return self._queue.get(block=False)
-        except Empty:
-            return None
+    def new_sequence(self) -> int:
+        return next(self._sequence_ids)
 
-    def push(self, task_packet: TaskPacket):
-        self._queue.put(task_packet)
+    def get(self) -> Optional[TaskPacket]:
+        with self._cond:
+            sequence = self._next_ready(self.clock.time())
+            if sequence is None:
+                return None
+            packet = sequence.packets.popleft()
+            self._drop_if_done(sequence)
+            return packet
+
+    def push(self, task_packet: TaskPacket,
+             sequence: int = DEFAULT_SEQUENCE,
+             priority: TaskPriority = TaskPriority.Normal):
+        self.push_many((task_packet,), sequence, priority)
+
+    def push_many(self, task_packets: Sequence[TaskPacket],
+                  sequence: int = DEFAULT_SEQUENCE,
+                  priority: TaskPriority = TaskPriority.Normal):
+        """
+        Appends all the packets under one lock, so the dispatcher never sees
+        the sequence half pushed.
+        """
+        with self._cond:
+            task_sequence = self._sequences.get(sequence)
+            if task_sequence is None:
+                task_sequence = TaskSequence(sequence, priority)
+                self._sequences[sequence] = task_sequence
+            elif priority < task_sequence.priority:
+                task_sequence.priority = priority
+
+            now = self.clock.time()
+            for task_packet in task_packets:
+                task_packet.sequence = sequence
+                task_packet.priority = task_sequence.priority
+                task_packet.order = next(self._order)
+                task_packet.pushed_at = now
+                task_sequence.packets.append(task_packet)
+            self._notify()
+
+    def delay(self, sequence: int, seconds: float):
+        """
+        Delays the next task of `sequence` (Task.App.Wait).
+        """
+        with self._cond:
+            task_sequence = self._sequences.get(sequence)
+            if task_sequence is None:
+                task_sequence = TaskSequence(sequence, TaskPriority.Normal)
+                self._sequences[sequence] = task_sequence
+            task_sequence.ready_at = self.clock.time() + seconds
+            self._notify()
+
+    def hold(self, sequence: int):
+        """
+        Keeps `sequence` from running its next task until release().
+        """
+        with self._cond:
+            task_sequence = self._sequences.get(sequence)
+            if task_sequence is None:
+                task_sequence = TaskSequence(sequence, TaskPriority.Normal)
+                self._sequences[sequence] = task_sequence
+            task_sequence.held = True
+
+    def release(self, sequence: int):
+        with self._cond:
+            task_sequence = self._sequences.get(sequence)
+            if task_sequence is not None:
+                task_sequence.held = False
+                self._drop_if_done(task_sequence)
+            self._notify()
+
+    def cancel(self, sequence: int) -> int:
+        """
+        Drops the pending tasks of `sequence`. Returns how many were dropped.
+
+        A held sequence (one of its tasks is running) is kept until release():
+        whatever is pushed into it afterwards still runs after that task.
+        """
+        with self._cond:
+            task_sequence = self._sequences.get(sequence)
+            if task_sequence is None:
+                return 0
+            dropped = len(task_sequence.packets)
+            task_sequence.packets.clear()
+            task_sequence.ready_at = 0.0
+            if not task_sequence.held:
+                del self._sequences[sequence]
+            self._notify()
+            return dropped
+
+    def pending(self, sequence: int) -> bool:
+        with self._cond:
+            task_sequence = self._sequences.get(sequence)
+            return task_sequence is not None and len(task_sequence.packets) > 0
+
+    def wait_ready(self, interrupted: Callable[[], bool]) -> bool:
+        """
+        Blocks without polling until there are tasks to dispatch: some sequence
+        has a task whose delay has passed and the previous dispatch has
+        finished. Returns False if `interrupted()` became True, so wake() must
+        be called after requesting the stop.
+
+        On True the caller owns the dispatch and must end it with dispatch_done().
+        """
+        with self._cond:
+            while not interrupted():
+                if self._dispatched:
+                    self._cond.wait()
+                    continue
+
+                remaining = self._ready_in(self.clock.time())
+                if remaining is None:
+                    self._cond.wait()
+                    continue
+                if remaining > 0:
+                    self.clock.wait(self._cond, remaining)
+                    continue
+
+                self._dispatched = True
+                return True
+        return False
+
+    def add_waker(self, waker: Callable[[], None]):
+        """
+        Registers `waker` to be called (under the queue lock, so it must not
+        block) every time the consumer would be woken up.
+        """
+        with self._cond:
+            self._wakers.append(waker)
+
+    def remove_waker(self, waker: Callable[[], None]):
+        with self._cond:
+            if waker in self._wakers:
+                self._wakers.remove(waker)
+
+    def next_ready_in(self) -> Optional[float]:
+        """
+        Seconds until some sequence can run (0 if one can now), None if there
+        is nothing pending.
+        """
+        with self._cond:
+            return self._ready_in(self.clock.time())
+
+    def dispatch_done(self):
+        with self._cond:
+            self._dispatched = False
+            self._notify()
+
+    def wake(self):
+        with self._cond:
+            self._notify()
 
     def len(self):
-        return self._queue.qsize()
+        with self._cond:
+            return sum(len(sequence.packets) for sequence in self._sequences.values())
 
     def empty(self):
-        return self._queue.empty()
+        return self.len() == 0
 
     def clear(self):
-        while not self._queue.empty():
-            try:
-                self._queue.get(block=False)
-            except Empty:
-                break
+        with self._cond:
+            self._sequences.clear()
+            self._notify()
+
+    def _notify(self):
+        self._cond.notify_all()
+        for waker in self._wakers:
+            waker()
+
+    def _next_ready(self, now: float) -> Optional[TaskSequence]:
+        best = None
+        finished = []
+        for sequence in self._sequences.values():
+            ready_in = sequence.ready_in(now)
+            if ready_in is None and not sequence.packets:
+                finished.append(sequence)
+            if ready_in != 0.0:
+                continue
+            if best is None or \
+                    (sequence.priority, sequence.packets[0].order) < \
+                    (best.priority, best.packets[0].order):
+                best = sequence
+
+        for sequence in finished:
+            self._drop_if_done(sequence)
+        return best
+
+    def _ready_in(self, now: float) -> Optional[float]:
+        result = None
+        for sequence in self._sequences.values():
+            ready_in = sequence.ready_in(now)
+            if ready_in is not None and (result is None or ready_in < result):
+                result = ready_in
+        return result
+
+    def _drop_if_done(self, sequence: TaskSequence):
+        # Las secuencias vacías se olvidan salvo que tengan una espera pendiente
+        if not sequence.packets and not sequence.held \
+                and sequence.ready_at <= self.clock.time() \
+                and sequence.id != self.DEFAULT_SEQUENCE:
+            del self._sequences[sequence.id]
 
     def __str__(self) -> str:
-        queue_copy = copy.deepcopy(self._queue)
-        items: List[str] = []
-
-        # Transferir los elementos de la cola copiada a una lista de cadenas
-        while not queue_copy.empty():
-            item = queue_copy.get(block=False)
-            items.append(str(item))
-
-        # Convertir los elementos en una cadena
-        items_str = ', '.join(items)
+        with self._cond:
+            packets = [packet for sequence in self._sequences.values()
+                       for packet in sequence.packets]
+        packets.sort(key=lambda packet: packet.order)
+        items_str = ', '.join(str(packet) for packet in packets)
         return f"TaskQueue([{items_str}])"
 
 
@@ -240,13 +605,14 @@ class TaskQueue(VarsChildren):
 
 
 class Vars:
-    def __init__(self, arg_):
+    def __init__(self, arg_, clock: Clock = system_clock):
         self.arg = Args(arg_)
+        self.clock = clock
         self.app = AppVars()
         self.ff = FFVars(last_pos_ = self.arg.pos,
                          last_size_= self.arg.size)
         self.tar = TargetVars()
-        self.tqueue = TaskQueue()
+        self.tqueue = TaskQueue(clock)
 
     def __str__(self):
         msg = "\n [ Vars ]"
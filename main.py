@@ -4,12 +4,18 @@ from PyQt6.QtWidgets import QApplication
 from PyQt6.QtCore import QObject
 from src.shared import ExitReason
 from src.sys_window import WindowManager
+from src.metrics import metrics
+from src.trace import tracer
+from src.wm_backend import FakeBackend, create_backend
+from src.window_match import WindowMatcher
 from src.sys_keyboard import SystemKeyboard
 from core.ffchat import FFChat
 from core.vars import Vars
 from core.thread import ThreadManager
 from core.action import Action
 from core.event import EventManager
+from core.replay import TaskReplayer, recorder
+import threading
 
 os.environ['QT_IM_MODULE'] = 'fcitx5'
 
@@ -29,6 +35,7 @@ os.environ['QT_IM_MODULE'] = 'fcitx5'
 # }
 
 args = {
+    # Texto exacto o con prefijo "re:", "glob:" o "fuzzy:"
     "tname": "FINAL FANTASY XIV",
     # "tclass": "kitty.kitty",
     "tclass": None,
@@ -40,7 +47,28 @@ args = {
     # "pos": (595,315),
     "pos": (510, -200),
     "qtargs": [],
-    "res": (1920, 1080)
+    "res": (1920, 1080),
+    # Mantener el registro de ventanas con eventos X en lugar de wmctrl
+    "wm_events": True,
+    # "bspwm" | "ewmh" | "fake"
+    "wm_backend": "bspwm",
+    # "threads" (ControlThread + WorkingThread) | "asyncio" (core/engine.py)
+    "engine": "threads",
+    # Métricas de tareas en formato Prometheus, p.ej. "/tmp/ffchat.prom"
+    "metrics_file": None,
+    # Trazas de cada acción en JSON de Chrome (chrome://tracing, Perfetto)
+    "trace_file": None,
+    # Grabar el flujo de tareas (JSONL) y reproducir una grabación al arrancar
+    "record_file": None,
+    "replay_file": None,
+    # Multiplicador del tiempo original; None = lo más rápido posible
+    "replay_speed": 1.0,
+    # {"ctrl+enter": "open", "ctrl+d": "cancel", ...}; None = las de src/hotkey.py
+    "hotkeys": None,
+    # "pynput" (listener global) | "xgrab" (XGrabKey, solo las hotkeys)
+    "keyboard_backend": "pynput",
+    # "clipboard" (Ctrl+V) | "xtest" (escribe el texto con XTest, sin portapapeles)
+    "send_mode": "clipboard"
 }
 
 
@@ -51,24 +79,84 @@ class Main(QObject):
         self._vars = Vars(args) 
         self._app: QApplication = app
         self._ffchat: FFChat = ffchat
-        self._wm = WindowManager()
-        self._sys_kb = SystemKeyboard()
+        backend = create_backend(self._vars.arg.wm_backend, self._vars.clock)
+        if isinstance(backend, FakeBackend):
+            self._seed_fake_wm(backend)
+        self._wm = WindowManager(backend,
+                                 event_driven=self._vars.arg.wm_events,
+                                 clock=self._vars.clock)
+        self._sys_kb = SystemKeyboard(self._vars.arg.keyboard_backend, self._vars.clock)
         self._action = Action(self._vars, self._app, 
                                self._ffchat, self._wm, self._sys_kb, 
                                self.stop)
 
         self._tm = ThreadManager(self._action)
         self._em = EventManager(self._ffchat, self._sys_kb, self._action)
+        self._replay_stop = threading.Event()
+
+    def _seed_fake_wm(self, backend: FakeBackend):
+        """
+        "wm_backend": "fake" starts with the configured target and FFChat
+        itself, so the app (and a replay) runs end to end without a WM.
+        """
+        arg = self._vars.arg
+        # Los patrones (re:, glob:, fuzzy:) se usan tal cual sin el prefijo
+        def literal(value: Optional[str], default: str) -> str:
+            if value is None:
+                return default
+            return value.split(":", 1)[1] if value.split(":", 1)[0] in ("re", "glob", "fuzzy") else value
+
+        tid = backend.create_window(literal(arg.tname, "Fake Target"),
+                                    literal(arg.tclass, "fake.Target"),
+                                    pid=arg.tpid or 0,
+                                    wm_window_role=literal(arg.trole, ""),
+                                    w=arg.res[0], h=arg.res[1])
+        matcher = WindowMatcher.from_args(arg.tname, arg.tclass, arg.tpid, arg.trole)
+        target = next(window for window in backend.list_windows() if window.id == tid)
+        if not matcher.evaluate(target):
+            print(f"El target falso no cumple {matcher}; usa tname/tclass literales con wm_backend fake")
+
+        # winId() crea ya la ventana nativa: es el mismo id que verá showEvent
+        backend.create_window("FFChat", "python3.FFChat", xid=int(self._ffchat.winId()),
+                              w=arg.size[0], h=arg.size[1])
+        backend.set_active(tid)
 
     def run(self):
+        if self._vars.arg.metrics_file is not None:
+            metrics.start_file(self._vars.arg.metrics_file)
+        tracer.enabled = self._vars.arg.trace_file is not None
+        tracer.clock = self._vars.clock
+        if self._vars.arg.record_file is not None:
+            recorder.clock = self._vars.clock
+            recorder.start()
+        self._tm.run_window_events()
         self._tm.run_starting(wait=True)
-        self._tm.run_working()
-        self._tm.run_control()
+        if self._vars.arg.engine == "asyncio":
+            self._tm.run_engine()
+        else:
+            self._tm.run_working()
+            self._tm.run_control()
 
         self._em.run_ff_events()
         self._em.run_sys_kb_events()
+        self._run_replay()
 
         return self._app.exec()
+
+    def _run_replay(self):
+        if self._vars.arg.replay_file is None:
+            return
+        replayer = TaskReplayer.load(self._vars.arg.replay_file)
+        print(f"Reproduciendo {self._vars.arg.replay_file}")
+        print(replayer.summary())
+        thread = threading.Thread(
+            target=replayer.replay,
+            args=(self._action.thandler, self._vars.arg.replay_speed, self._replay_stop),
+            kwargs={"clock": self._vars.clock},
+            name="replay",
+            daemon=True
+        )
+        thread.start()
     
     def stop(self, reason: ExitReason, extra_msg: Optional[str] = None):
         print(f"\n")
@@ -77,8 +165,21 @@ class Main(QObject):
         print(f"    ExtraMsg: {extra_msg}")
         print(f"\n")
         
-        self._tm.stop_control()
-        self._tm.stop_working()
+        self._replay_stop.set()
+        # Antes de parar los hilos: ninguno debe quedarse esperando al bucle de Qt
+        self._action.ff.shutdown()
+        if self._vars.arg.engine == "asyncio":
+            self._tm.stop_engine()
+        else:
+            self._tm.stop_control()
+            self._tm.stop_working()
+        self._action.thandler.shutdown()
+        metrics.stop_file()
+        if self._vars.arg.trace_file is not None:
+            tracer.export(self._vars.arg.trace_file)
+        if self._vars.arg.record_file is not None:
+            recorder.save(self._vars.arg.record_file)
+        self._tm.stop_window_events()
         self._em.stop_ffevents()
         self._ffchat.close()
         self._app.quit()
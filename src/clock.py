@@ -0,0 +1,114 @@
+from typing import Callable, List, Optional, Tuple
+import heapq
+import itertools
+import threading
+import time
+
+"""
+Time source shared by the task engine (TaskQueue, TaskHandler, locate
+retries...). The real one is the system clock; SimulatedClock only moves
+when something sleeps or waits, so scheduler runs become deterministic and
+take no real time:
+
+    clock = SimulatedClock()
+    queue = TaskQueue(clock)
+    ...
+    clock.sleep(0.15)   # returns at once, clock.time() is 0.15 later
+"""
+
+
+class Clock:
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def wait(self, cond: threading.Condition, timeout: Optional[float] = None) -> bool:
+        """
+        cond.wait() measured on this clock. The caller holds `cond`.
+        """
+        return cond.wait(timeout)
+
+    def wait_event(self, event: threading.Event, timeout: float) -> bool:
+        """
+        event.wait() measured on this clock.
+        """
+        return event.wait(timeout)
+
+    def call_later(self, delay: float, fn: Callable[[], None]) -> None:
+        """
+        Runs `fn` once, `delay` seconds from now, on another thread.
+        """
+        timer = threading.Timer(delay, fn)
+        timer.daemon = True
+        timer.start()
+
+
+class SimulatedClock(Clock):
+    """
+    Virtual time. sleep() and timed waits advance it instead of blocking;
+    a wait without timeout still blocks until another thread notifies.
+    call_later() callbacks run inline, in order, as the time passes them.
+    """
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._lock = threading.Lock()
+        self._timers: List[Tuple[float, int, Callable[[], None]]] = []
+        self._timer_ids = itertools.count()
+
+    def time(self) -> float:
+        with self._lock:
+            return self._now
+
+    def monotonic(self) -> float:
+        return self.time()
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> None:
+        with self._lock:
+            target = self._now + max(0.0, seconds)
+        while True:
+            with self._lock:
+                if not self._timers or self._timers[0][0] > target:
+                    self._now = max(self._now, target)
+                    return
+                due, _, fn = heapq.heappop(self._timers)
+                self._now = max(self._now, due)
+            fn()
+
+    def call_later(self, delay: float, fn: Callable[[], None]) -> None:
+        with self._lock:
+            heapq.heappush(self._timers, (self._now + max(0.0, delay), next(self._timer_ids), fn))
+
+    def wait(self, cond: threading.Condition, timeout: Optional[float] = None) -> bool:
+        if timeout is None:
+            return cond.wait()
+        # Lo que se iba a esperar ya ha pasado, o hasta el siguiente timer si
+        # vence antes: su callback puede ser justo lo que se espera
+        with self._lock:
+            step = timeout
+            if self._timers:
+                step = min(step, max(0.0, self._timers[0][0] - self._now))
+        cond.release()
+        try:
+            self.advance(step)
+        finally:
+            cond.acquire()
+        return step < timeout
+
+    def wait_event(self, event: threading.Event, timeout: float) -> bool:
+        if not event.is_set():
+            self.advance(timeout)
+        return event.is_set()
+
+    def __str__(self):
+        return f"SimulatedClock(t={self.time():.6f})"
+
+
+system_clock = Clock()
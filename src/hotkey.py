@@ -0,0 +1,115 @@
+from typing import Dict, FrozenSet, Optional, Tuple
+from enum import Enum, IntFlag
+
+
+class Modifier(IntFlag):
+    NONE = 0
+    CTRL = 1
+    SHIFT = 2
+    ALT = 4
+    SUPER = 8
+    # ISO_Level3_Shift, en Mod5: no es Alt
+    ALTGR = 16
+
+
+# Nombres de pynput (Key.<name>) de cada modificador
+MODIFIER_KEYS: Dict[str, Modifier] = {
+    "ctrl": Modifier.CTRL, "ctrl_l": Modifier.CTRL, "ctrl_r": Modifier.CTRL,
+    "shift": Modifier.SHIFT, "shift_l": Modifier.SHIFT, "shift_r": Modifier.SHIFT,
+    "alt": Modifier.ALT, "alt_l": Modifier.ALT, "alt_r": Modifier.ALT,
+    "alt_gr": Modifier.ALTGR,
+    "cmd": Modifier.SUPER, "cmd_l": Modifier.SUPER, "cmd_r": Modifier.SUPER,
+}
+
+# Lo que se acepta en la config además de los nombres de pynput
+MODIFIER_NAMES: Dict[str, Modifier] = {
+    "ctrl": Modifier.CTRL, "control": Modifier.CTRL,
+    "shift": Modifier.SHIFT,
+    "alt": Modifier.ALT,
+    "altgr": Modifier.ALTGR,
+    "super": Modifier.SUPER, "cmd": Modifier.SUPER, "win": Modifier.SUPER,
+}
+
+KEY_ALIASES: Dict[str, str] = {"return": "enter", "escape": "esc"}
+
+DEFAULT_HOTKEYS: Dict[str, str] = {
+    "ctrl+enter": "open",
+    "ctrl+d": "cancel",
+    "ctrl+e": "edit-and-escape",
+    "ctrl+l": "clear",
+    "ctrl+f": "focus-ffchat",
+    "ctrl+r": "restore",
+    "shift+f8": "exit",
+}
+
+Binding = Tuple[int, str]
+
+
+def key_id(key) -> Optional[str]:
+    """
+    Hashable id of a pynput key: the Key name ("enter", "f8") or the
+    lowercase char of a KeyCode. None for keys without either.
+    """
+    if isinstance(key, Enum):
+        return key.name
+    char = getattr(key, "char", None)
+    if char is not None:
+        return char.lower()
+    vk = getattr(key, "vk", None)
+    return None if vk is None else f"vk{vk}"
+
+
+def parse_combo(combo: str) -> Binding:
+    """
+    "ctrl+shift+enter" -> (CTRL | SHIFT, "enter")
+    """
+    parts = [part.strip().lower() for part in combo.split("+") if part.strip()]
+    if not parts:
+        raise ValueError(f"Hotkey vacía: {combo!r}")
+
+    mask = Modifier.NONE
+    for part in parts[:-1]:
+        modifier = MODIFIER_NAMES.get(part)
+        if modifier is None:
+            raise ValueError(f"Modificador desconocido en {combo!r}: {part}")
+        mask |= modifier
+
+    key = KEY_ALIASES.get(parts[-1], parts[-1])
+    return int(mask), key
+
+
+class HotkeyTable:
+    """
+    (modifier mask, key) -> action name, precomputed from the config.
+
+    resolve() is one dict lookup; keys that are not part of any binding are
+    rejected before even looking at the modifiers.
+    """
+    def __init__(self, bindings: Optional[Dict[str, str]] = None):
+        bindings = DEFAULT_HOTKEYS if bindings is None else bindings
+        self._table: Dict[Binding, str] = {}
+        for combo, action in bindings.items():
+            binding = parse_combo(combo)
+            if binding in self._table:
+                raise ValueError(f"Hotkey repetida: {combo!r}")
+            self._table[binding] = action
+        self.keys: FrozenSet[str] = frozenset(key for _, key in self._table)
+
+    def resolve(self, mask: int, key: Optional[str]) -> Optional[str]:
+        if key not in self.keys:
+            return None
+        return self._table.get((mask, key))
+
+    def actions(self) -> FrozenSet[str]:
+        return frozenset(self._table.values())
+
+    def bindings(self) -> Dict[Binding, str]:
+        return dict(self._table)
+
+    def __str__(self):
+        msg = "[ Hotkeys ]"
+        for (mask, key), action in sorted(self._table.items(), key=lambda item: item[1]):
+            combo = "+".join([modifier.name.lower() for modifier in Modifier
+                              if modifier and mask & modifier] + [key])
+            msg += f"\n  {combo:<16} -> {action}"
+        return msg
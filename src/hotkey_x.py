@@ -0,0 +1,131 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import select
+import threading
+from Xlib import X, XK
+from src.hotkey import HotkeyTable, Modifier
+from src.sys_display import XConnection, xconn
+
+"""
+Hotkeys through passive XGrabKey grabs on the root window.
+
+Only the bound combinations reach Python. The grabs are synchronous and
+every press is replayed with XAllowEvents(ReplayKeyboard), so the focused
+window (the game) still receives the keys, as it did with the pynput
+listener.
+"""
+
+
+MODIFIER_MASKS: Dict[Modifier, int] = {
+    Modifier.CTRL: X.ControlMask,
+    Modifier.SHIFT: X.ShiftMask,
+    Modifier.ALT: X.Mod1Mask,
+    Modifier.SUPER: X.Mod4Mask,
+    Modifier.ALTGR: X.Mod5Mask,
+}
+
+# Bloq Mayús y Bloq Num no deben impedir que salte la hotkey
+LOCK_MASKS = (0, X.LockMask, X.Mod2Mask, X.LockMask | X.Mod2Mask)
+RELEVANT_MASK = X.ControlMask | X.ShiftMask | X.Mod1Mask | X.Mod4Mask | X.Mod5Mask
+
+KEYSYM_NAMES: Dict[str, str] = {
+    "enter": "Return", "esc": "Escape", "space": "space", "tab": "Tab",
+    "backspace": "BackSpace", "delete": "Delete", "insert": "Insert",
+    "home": "Home", "end": "End", "page_up": "Prior", "page_down": "Next",
+    "up": "Up", "down": "Down", "left": "Left", "right": "Right",
+}
+
+
+def keysym_for(key: str) -> int:
+    name = KEYSYM_NAMES.get(key)
+    if name is None and key.startswith("f") and key[1:].isdigit():
+        name = key.upper()
+    keysym = XK.string_to_keysym(name if name is not None else key)
+    if keysym == X.NoSymbol and len(key) == 1 and ord(key) < 0x100:
+        # En Latin-1 el keysym coincide con el código
+        keysym = ord(key)
+    return keysym
+
+
+def x_mask(mask: int) -> int:
+    result = 0
+    for modifier, bits in MODIFIER_MASKS.items():
+        if mask & modifier:
+            result |= bits
+    return result
+
+
+class XHotkeyGrabber:
+    def __init__(self, table: HotkeyTable, on_hotkey: Callable[[str], None]):
+        self._table = table
+        self._on_hotkey = on_hotkey
+        self._conn: Optional[XConnection] = None
+        self._grabs: Dict[Tuple[int, int], str] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        conn = xconn.open("hotkeys")
+        self._conn = conn
+        display = conn.display
+        failed: List[str] = []
+
+        for (mask, key), action in self._table.bindings().items():
+            keycode = display.keysym_to_keycode(keysym_for(key))
+            if keycode == 0:
+                print(f"Hotkey {key} ({action}): la tecla no está en el mapa de teclado")
+                continue
+            modifiers = x_mask(mask)
+            for lock in LOCK_MASKS:
+                conn.root.grab_key(keycode, modifiers | lock, True,
+                                   X.GrabModeAsync, X.GrabModeSync,
+                                   onerror=lambda *_, action=action: failed.append(action))
+            self._grabs[(keycode, modifiers)] = action
+
+        with conn.timed("GrabKey"):
+            display.sync()
+        for action in sorted(set(failed)):
+            # BadAccess: otro cliente (el WM, p.ej. sxhkd) ya tiene esa combinación
+            print(f"Hotkey {action}: la combinación ya está capturada por otro programa")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="hotkeys", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._conn is not None:
+            display = self._conn.display
+            for keycode, modifiers in self._grabs:
+                for lock in LOCK_MASKS:
+                    self._conn.root.ungrab_key(keycode, modifiers | lock)
+            display.flush()
+            xconn.close(self._conn)
+            self._conn = None
+        self._grabs.clear()
+
+    def _loop(self) -> None:
+        assert self._conn is not None
+        display = self._conn.display
+        while not self._stop.is_set():
+            while display.pending_events():
+                self._handle(display.next_event())
+            select.select([display.fileno()], [], [], 0.5)
+
+    def _handle(self, event) -> None:
+        if event.type != X.KeyPress:
+            return
+        assert self._conn is not None
+        display = self._conn.display
+        # Que la pulsación siga hacia la ventana con el foco
+        display.allow_events(X.ReplayKeyboard, event.time)
+        display.flush()
+
+        action = self._grabs.get((event.detail, event.state & RELEVANT_MASK))
+        if action is not None:
+            try:
+                self._on_hotkey(action)
+            except Exception as e:
+                print(f"Error en la hotkey {action}: {e}")
@@ -0,0 +1,212 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import threading
+
+"""
+Task metrics in Prometheus text format (exposition format 0.0.4).
+
+The file is written atomically so it can be scraped directly or picked up by
+node_exporter's textfile collector:
+    metrics.start_file("/tmp/ffchat.prom", interval=5.0)
+"""
+
+
+# Segundos: de 0.5 ms a 2.5 s, el rango que tiene sentido para el overlay
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+DEPTH_BUCKETS: Tuple[float, ...] = (0, 1, 2, 4, 8, 16, 32, 64)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts: List[int] = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name: str, labels: str = "") -> List[str]:
+        sep = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class TaskMetrics:
+    """
+    Per TaskType latency histograms and TaskQueue depth.
+
+        - wait: from TaskQueue.push() to the start of the handler (includes
+          Task.App.Wait delays of the sequence, as the user perceives it)
+        - run: handler execution time
+        - depth: pending tasks each time the dispatcher takes one
+    """
+    PREFIX = "ffchat"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wait: Dict[str, Histogram] = {}
+        self._run: Dict[str, Histogram] = {}
+        self._errors: Dict[str, int] = {}
+        self._macro: Dict[str, Histogram] = {}
+        self._macro_over_budget: Dict[str, int] = {}
+        self._macro_cancelled: Dict[str, int] = {}
+        self._depth = Histogram(DEPTH_BUCKETS)
+        self._depth_last = 0
+        self._depth_max = 0
+        self._writer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def task_started(self, task_type: str, pushed_at: float, started_at: float) -> None:
+        with self._lock:
+            histogram = self._wait.get(task_type)
+            if histogram is None:
+                histogram = self._wait[task_type] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(max(0.0, started_at - pushed_at))
+
+    def task_finished(self, task_type: str, started_at: float, finished_at: float,
+                      failed: bool = False) -> None:
+        with self._lock:
+            histogram = self._run.get(task_type)
+            if histogram is None:
+                histogram = self._run[task_type] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(finished_at - started_at)
+            if failed:
+                self._errors[task_type] = self._errors.get(task_type, 0) + 1
+
+    def macro_finished(self, macro: str, duration: float, budget: float,
+                       cancelled: bool = False) -> None:
+        with self._lock:
+            if cancelled:
+                self._macro_cancelled[macro] = self._macro_cancelled.get(macro, 0) + 1
+                return
+            histogram = self._macro.get(macro)
+            if histogram is None:
+                histogram = self._macro[macro] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(duration)
+            if duration > budget:
+                self._macro_over_budget[macro] = self._macro_over_budget.get(macro, 0) + 1
+
+    def queue_depth(self, depth: int) -> None:
+        with self._lock:
+            self._depth.observe(depth)
+            self._depth_last = depth
+            if depth > self._depth_max:
+                self._depth_max = depth
+
+    def render(self) -> str:
+        prefix = self.PREFIX
+        with self._lock:
+            lines = [
+                f"# HELP {prefix}_task_wait_seconds Time from push to handler start.",
+                f"# TYPE {prefix}_task_wait_seconds histogram",
+            ]
+            for task_type, histogram in sorted(self._wait.items()):
+                lines += histogram.lines(f"{prefix}_task_wait_seconds", f'task="{task_type}"')
+
+            lines += [
+                f"# HELP {prefix}_task_run_seconds Handler execution time.",
+                f"# TYPE {prefix}_task_run_seconds histogram",
+            ]
+            for task_type, histogram in sorted(self._run.items()):
+                lines += histogram.lines(f"{prefix}_task_run_seconds", f'task="{task_type}"')
+
+            lines += [
+                f"# HELP {prefix}_task_errors_total Handlers that raised.",
+                f"# TYPE {prefix}_task_errors_total counter",
+            ]
+            for task_type, count in sorted(self._errors.items()):
+                lines.append(f'{prefix}_task_errors_total{{task="{task_type}"}} {count}')
+
+            lines += [
+                f"# HELP {prefix}_macro_seconds Macro runs, from push to the end of the last task.",
+                f"# TYPE {prefix}_macro_seconds histogram",
+            ]
+            for macro, histogram in sorted(self._macro.items()):
+                lines += histogram.lines(f"{prefix}_macro_seconds", f'macro="{macro}"')
+
+            lines += [
+                f"# HELP {prefix}_macro_over_budget_total Macro runs slower than their budget.",
+                f"# TYPE {prefix}_macro_over_budget_total counter",
+            ]
+            for macro, count in sorted(self._macro_over_budget.items()):
+                lines.append(f'{prefix}_macro_over_budget_total{{macro="{macro}"}} {count}')
+
+            lines += [
+                f"# HELP {prefix}_macro_cancelled_total Macro runs cancelled before finishing.",
+                f"# TYPE {prefix}_macro_cancelled_total counter",
+            ]
+            for macro, count in sorted(self._macro_cancelled.items()):
+                lines.append(f'{prefix}_macro_cancelled_total{{macro="{macro}"}} {count}')
+
+            lines += [
+                f"# HELP {prefix}_queue_depth Pending tasks when the last one was taken.",
+                f"# TYPE {prefix}_queue_depth gauge",
+                f"{prefix}_queue_depth {self._depth_last}",
+                f"# HELP {prefix}_queue_depth_max Highest queue depth seen.",
+                f"# TYPE {prefix}_queue_depth_max gauge",
+                f"{prefix}_queue_depth_max {self._depth_max}",
+                f"# HELP {prefix}_queue_depth_samples Queue depth each time a task is taken.",
+                f"# TYPE {prefix}_queue_depth_samples histogram",
+            ]
+            lines += self._depth.lines(f"{prefix}_queue_depth_samples")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        # Escritura atómica para que nunca se lea un fichero a medias
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def start_file(self, path: str, interval: float = 5.0) -> None:
+        if self._writer is not None:
+            return
+        self._stop.clear()
+
+        def flush_loop():
+            while not self._stop.wait(interval):
+                self._flush(path)
+            self._flush(path)
+
+        self._writer = threading.Thread(target=flush_loop, name="metrics", daemon=True)
+        self._writer.start()
+
+    def stop_file(self) -> None:
+        if self._writer is None:
+            return
+        self._stop.set()
+        self._writer.join()
+        self._writer = None
+
+    def _flush(self, path: str) -> None:
+        try:
+            self.write(path)
+        except OSError as e:
+            print(f"No se han podido escribir las métricas en {path}: {e}")
+
+    def __str__(self):
+        return self.render()
+
+
+metrics = TaskMetrics()
+
+
+def task_name(task_type) -> str:
+    # "FF.Show", "App.Wait"... igual que se escriben en el código
+    return f"{type(task_type).__name__}.{task_type.name}"
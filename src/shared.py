@@ -1,5 +1,5 @@
-from enum import Enum, auto
-from typing import Any, Dict, Tuple, Callable
+from enum import Enum, IntEnum, auto
+from typing import Any, Dict, Optional, Tuple, Callable
 import time
 
 
@@ -116,6 +116,7 @@ class Task:
         BetaRestore = auto()
 
         CopyInput = auto()
+        TypeInput = auto()
         ClearInput = auto()
 
         @classmethod
@@ -138,6 +139,7 @@ class Task:
         SwitchToKeyboard = auto()
 
         Wait = auto()
+        WaitFor = auto()
         UpdateWindows = auto()
         
         @classmethod
@@ -152,11 +154,49 @@ class Task:
             }
 
 
+class WaitCondition(FFEnum):
+    """
+    Observable states Task.App.WaitFor can wait on instead of a fixed delay.
+    """
+    TargetFocused = auto()
+    ClipboardReady = auto()
+    FFChatHidden = auto()
+
+    @classmethod
+    def _messages(cls) -> Dict[FFEnum, str]:
+        return {
+            cls.TargetFocused: "The target window has the input focus.",
+            cls.ClipboardReady: "The clipboard holds the text copied from FFChat.",
+            cls.FFChatHidden: "FFChat has been hidden.",
+        }
+
+
+class TaskPriority(IntEnum):
+    """
+    Lower runs first. Exit preempts everything, including pending delays.
+    """
+    Exit = 0
+    High = 10
+    Normal = 20
+    Low = 30
+
+
 class TaskPacket:
-    def __init__(self, task_type: TaskType, args: Tuple[Any, ...] = (), kwargs: Dict[str, Any] = {}):
+    def __init__(self, task_type: TaskType, args: Tuple[Any, ...] = (),
+                 kwargs: Optional[Dict[str, Any]] = None,
+                 handler: Optional[TaskFunction] = None, macro: Any = None):
         self._task_type = task_type
         self._args = args
-        self._kwargs = kwargs
+        self._kwargs = {} if kwargs is None else kwargs
+        # Resuelto de antemano por las macros; si no, TaskHandler lo busca por tipo
+        self.handler = handler
+        # MacroRun a la que pertenece (core/macro.py)
+        self.macro = macro
+        # Asignados por TaskQueue.push()
+        self.sequence = 0
+        self.priority = TaskPriority.Normal
+        self.order = 0
+        self.pushed_at = 0.0
 
     @property
     def task_type(self):
@@ -176,6 +216,6 @@ class TaskPacket:
     def __str__(self):
         args_str = ', '.join(map(str, self.args))
         kwargs_str = ', '.join(f"{key}={value}" for key, value in self.kwargs.items())
-        return f"Command(task_type={self.task_type}, args=({args_str}), kwargs={{ {kwargs_str} }})"
+        return f"Command(task_type={self.task_type}, args=({args_str}), kwargs={{ {kwargs_str} }}, sequence={self.sequence})"
 
 
@@ -0,0 +1,119 @@
+from typing import Dict, List, Optional
+from contextlib import contextmanager
+import threading
+import time
+import Xlib.display
+
+"""
+python-xlib connections are not thread safe, so every thread gets its own
+Display, opened lazily the first time it needs X.
+"""
+
+
+class XConnection:
+    def __init__(self, name: str):
+        self.name = name
+        self.display = Xlib.display.Display()
+        self.root = self.display.screen().root
+        self._atoms: Dict[str, int] = {}
+        self._requests: Dict[str, int] = {}
+        self._rtt_total: Dict[str, float] = {}
+        self._rtt_max: Dict[str, float] = {}
+
+    def atom(self, name: str) -> int:
+        # Los atoms no cambian durante la vida de la conexión
+        atom = self._atoms.get(name)
+        if atom is None:
+            with self.timed("InternAtom"):
+                atom = self.display.intern_atom(name)
+            self._atoms[name] = atom
+        return atom
+
+    @contextmanager
+    def timed(self, request: str):
+        """
+        Counts the request and measures its round trip:
+            with conn.timed("GetInputFocus"):
+                conn.display.get_input_focus()
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            self._requests[request] = self._requests.get(request, 0) + 1
+            self._rtt_total[request] = self._rtt_total.get(request, 0.0) + elapsed
+            if elapsed > self._rtt_max.get(request, 0.0):
+                self._rtt_max[request] = elapsed
+
+    def requests(self) -> int:
+        return sum(self._requests.values())
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for request, count in self._requests.items():
+            result[request] = {
+                "count": count,
+                "rtt_avg": self._rtt_total[request] / count,
+                "rtt_max": self._rtt_max[request],
+            }
+        return result
+
+    def close(self) -> None:
+        self.display.close()
+
+    def __str__(self):
+        msg = f"[{self.name}] requests={self.requests()}"
+        for request, stats in sorted(self.stats().items()):
+            msg += f"\n    {request}: count={stats['count']}"
+            msg += f", rtt_avg={stats['rtt_avg'] * 1000:.3f}ms"
+            msg += f", rtt_max={stats['rtt_max'] * 1000:.3f}ms"
+        return msg
+
+
+class XConnectionManager:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[XConnection] = []
+
+    def get(self) -> XConnection:
+        """
+        Connection of the calling thread. Opened on first use.
+        """
+        conn: Optional[XConnection] = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.open(threading.current_thread().name)
+            self._local.conn = conn
+        return conn
+
+    def open(self, name: str) -> XConnection:
+        """
+        Opens a dedicated connection (e.g. for an event loop) that is still
+        reported by stats(). The caller owns it and must close it.
+        """
+        conn = XConnection(name)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def close(self, conn: XConnection) -> None:
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        if getattr(self._local, "conn", None) is conn:
+            self._local.conn = None
+        conn.close()
+
+    def connections(self) -> List[XConnection]:
+        with self._lock:
+            return list(self._connections)
+
+    def __str__(self):
+        msg = "[ XConnectionManager ]"
+        for conn in self.connections():
+            msg += f"\n  {conn}"
+        return msg
+
+
+xconn = XConnectionManager()
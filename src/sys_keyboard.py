@@ -1,14 +1,47 @@
 from pynput import keyboard
-from typing import Callable
-import time
+from typing import Callable, Dict, Optional, Set
+from src.hotkey import HotkeyTable, Modifier, MODIFIER_KEYS, key_id
+import threading
+from src.clock import Clock, system_clock
+
+
+# Índices de GetModifierMapping: Shift, Lock, Control, Mod1 ... Mod5
+X_MODIFIER_ROWS: Dict[int, Modifier] = {
+    0: Modifier.SHIFT,
+    2: Modifier.CTRL,
+    3: Modifier.ALT,
+    6: Modifier.SUPER,
+    7: Modifier.ALTGR,
+}
 
 
 class SystemKeyboard:
-    def __init__(self):
+    # Tiempo que se mantienen pulsadas las teclas sintéticas. El juego
+    # muestrea el teclado por frame y no hay forma de saber cuándo lo ha
+    # leído, así que esta espera no puede ser por condición
+    KEY_HOLD = 0.1
+
+    def __init__(self, backend: str = "pynput", clock: Clock = system_clock):
+        """
+        backend:
+            - "pynput": listener global, recibe todas las teclas
+            - "xgrab": solo las hotkeys asignadas, con XGrabKey (src/hotkey_x.py)
+        """
+        if backend not in ("pynput", "xgrab"):
+            raise ValueError(f"Unknown keyboard backend: {backend}")
+        self.backend = backend
+        self._clock = clock
 
-        self.pressed_keys = set()
+        # Solo se siguen los modificadores, como máscara de src.hotkey.Modifier.
+        # Se escribe bajo _lock y se lee sin él (un int se lee de forma atómica)
+        self._modifiers = 0
+        self._held: Set[str] = set()
+        self._lock = threading.Lock()
+        self._x_modifiers: Optional[Dict[int, Modifier]] = None
         self._on_key_press: Callable 
         self._on_key_release: Callable
+        self._grabber = None
+        self._typer = None
 
         # Inicializar el listener
         self.listener = keyboard.Listener(
@@ -16,7 +49,10 @@ class SystemKeyboard:
             on_release=self._on_release # type: ignore
         )
 
-    def send_keystroke(self, keys):
+    def grabs_hotkeys(self) -> bool:
+        return self.backend == "xgrab"
+
+    def send_keystroke(self, keys, hold: Optional[float] = None):
         controller = keyboard.Controller()  # Crear una instancia de Controller
         for key in keys:
             if isinstance(key, str):
@@ -24,7 +60,7 @@ class SystemKeyboard:
             else:
                 controller.press(key)
 
-        time.sleep(0.1)
+        self._clock.sleep(self.KEY_HOLD if hold is None else hold)
         
         for key in reversed(keys):
             if isinstance(key, str):
@@ -32,22 +68,102 @@ class SystemKeyboard:
             else:
                 controller.release(key)
 
+    def type_text(self, text: str) -> int:
+        """
+        Types `text` into the focused window with XTest, without the
+        clipboard (src/xtest_typer.py). Returns the characters sent.
+        """
+        if self._typer is None:
+            from src.xtest_typer import XTestTyper
+            self._typer = XTestTyper(clock=self._clock)
+        return self._typer.type(text)
+
+    def modifiers(self) -> int:
+        """
+        Modifiers held right now, as a src.hotkey.Modifier mask.
+        """
+        return self._modifiers
+
+    def resync(self) -> int:
+        """
+        Rebuilds the mask from the server (QueryKeymap) to drop modifiers
+        whose release we missed, e.g. ctrl_l released while the focus was
+        changing. One X round trip.
+        """
+        from src.sys_display import xconn
+        conn = xconn.get()
+        if self._x_modifiers is None:
+            self._x_modifiers = self._query_modifier_keycodes()
+        with conn.timed("QueryKeymap"):
+            keymap = conn.display.query_keymap()
+
+        mask = 0
+        for keycode, modifier in self._x_modifiers.items():
+            if keymap[keycode // 8] >> (keycode % 8) & 1:
+                mask |= modifier
+        with self._lock:
+            # Los lados ya no se conocen: _held se queda con los que siguen
+            # pulsados y los bits sin nombre se mantienen hasta su liberación
+            self._held = {name for name in self._held if MODIFIER_KEYS[name] & mask}
+            self._modifiers = mask
+        return mask
+
+    def _query_modifier_keycodes(self) -> Dict[int, Modifier]:
+        from src.sys_display import xconn
+        conn = xconn.get()
+        with conn.timed("GetModifierMapping"):
+            mapping = conn.display.get_modifier_mapping()
+        result: Dict[int, Modifier] = {}
+        for row, modifier in X_MODIFIER_ROWS.items():
+            for keycode in mapping[row]:
+                if keycode:
+                    result[keycode] = modifier
+        return result
+
+    def _update_modifier(self, key, pressed: bool):
+        name = key_id(key)
+        if name not in MODIFIER_KEYS:
+            return
+        with self._lock:
+            modifier = int(MODIFIER_KEYS[name])
+            if pressed:
+                self._held.add(name)
+                self._modifiers |= modifier
+                return
+            self._held.discard(name)
+            # Incremental: no perder los bits que puso resync() sin nombre
+            if not any(MODIFIER_KEYS[held] & modifier for held in self._held):
+                self._modifiers &= ~modifier
+
     def _on_press(self, key: keyboard.Key):
-        self.pressed_keys.add(key)
+        self._update_modifier(key, True)
         self._on_key_press(key)  # Delegar el manejo del evento a la función proporcionada
 
     def _on_release(self, key: keyboard.Key):
-        if key in self.pressed_keys:
-            self.pressed_keys.remove(key)
+        self._update_modifier(key, False)
         self._on_key_release(key)  # Delegar el manejo del evento a la función proporcionada
     def assign_functions(self, on_key_press: Callable[[keyboard.Key], None], 
                          on_key_release: Callable[[keyboard.Key], None]):
         self._on_key_press = on_key_press
         self._on_key_release = on_key_release
 
+    def assign_hotkeys(self, table: HotkeyTable, on_hotkey: Callable[[str], None]):
+        """
+        Backend "xgrab": `on_hotkey(action)` is called for the bound
+        combinations only; assign_functions() callbacks are not used.
+        """
+        from src.hotkey_x import XHotkeyGrabber
+        self._grabber = XHotkeyGrabber(table, on_hotkey)
+
     def run(self):
-        self.listener.start()
+        if self._grabber is not None:
+            self._grabber.start()
+        else:
+            self.listener.start()
 
     def stop(self):
-        self.listener.stop()
+        if self._grabber is not None:
+            self._grabber.stop()
+        else:
+            self.listener.stop()
 
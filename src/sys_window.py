@@ -1,8 +1,12 @@
-from typing import List, Optional, Union
-import wmctrl
-import Xlib.display
-import Xlib.X
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+import threading
 from enum import Enum
+from src.clock import Clock, system_clock
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    from src.wm_backend import WMBackend
 
 """
 Mejora en un futuro: mejorar window para que no cree variables individuales sino que
@@ -16,109 +20,186 @@ class IdFormat(Enum):
     HEX8 = 4
 
 
-class IdConverter(Enum):
-    @staticmethod
-    def convert(
-        values: List[Union[str, int]],
-        *,
-        input: IdFormat,
-        output: IdFormat,
-    ):
-        int_values = IdConverter._convert_to_int(values, input)
-
-        # format to output 
-        result = []
-        if output == IdFormat.HEX:
-            result.extend(IdConverter._convert_to_hex(int_values))
-        elif output == IdFormat.HEX8:
-            result.extend(IdConverter._convert_to_hex10(int_values))
-        else:
-            result = int_values
-        
-        return result
-
-    @staticmethod
-    def _convert_to_int(values: List[Union[int, str]], input: IdFormat):
-        result = []
-        for value in values:
-            if isinstance(value, int):
-                result.append(value)
-            elif input == IdFormat.INT:
-                result.append(int(value))
-            else:
-                result.append(int(value, 16))
-        return result
-
-    @staticmethod
-    def _convert_to_hex(values: List[int]) -> List[str]:
-        result = []
-        for value in values:
-            result.append(hex(value))
-        return result
-
-    @staticmethod
-    def _convert_to_hex10(values: List[int]) -> List[str]:
-        result = []
-        for value in values:
-            result.append(f'0x{value:08x}')
-        return result
-
-
-def get_active(format: IdFormat):
-    active_id = disp.get_input_focus().focus.id
-    return IdConverter.convert([active_id],input=IdFormat.INT, output=format)[0]
-
-
-disp = Xlib.display.Display()
-root = disp.screen().root
+class ActiveWindowTracker:
+    """
+    Serves the active window id from memory.
+
+    While the backend events are running they feed it (_NET_ACTIVE_WINDOW
+    PropertyNotify on X). Otherwise (or with refresh=True) every read goes
+    to the backend.
+    """
+    def __init__(self, backend: "WMBackend", clock: Clock = system_clock):
+        self._backend = backend
+        self._clock = clock
+        self._active: Optional[int] = None
+        self._tracking = False
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._listeners: List[Callable[[int], None]] = []
+
+    @property
+    def tracking(self) -> bool:
+        return self._tracking
+
+    def get(self, format: IdFormat = IdFormat.INT, refresh: bool = False):
+        with self._lock:
+            active_id = self._active
+        if refresh or not self._tracking or active_id is None:
+            active_id = self.refresh()
+        return format_id(active_id, format)
+
+    def refresh(self) -> int:
+        """
+        Synchronous read of the active window (one X round trip on X backends).
+        """
+        active_id = self._backend.get_active()
+        self._set(active_id)
+        return active_id
+
+    def wait_for(self, active_id: int, timeout: float) -> bool:
+        """
+        Waits until `active_id` is the active window. With events it sleeps on
+        the focus notification, otherwise it polls the backend.
+        """
+        clock = self._clock
+        deadline = clock.monotonic() + timeout
+        if not self._tracking:
+            while True:
+                if self.refresh() == active_id:
+                    return True
+                if clock.monotonic() >= deadline:
+                    return False
+                clock.sleep(0.005)
+
+        with self._changed:
+            while self._active != active_id:
+                remaining = deadline - clock.monotonic()
+                if remaining <= 0:
+                    return False
+                clock.wait(self._changed, remaining)
+            return True
+
+    def subscribe(self, on_changed: Callable[[int], None]) -> None:
+        """
+        `on_changed(active_id)` runs, on the thread that noticed it, every
+        time the active window changes.
+        """
+        self._listeners.append(on_changed)
+
+    def _set(self, active_id: int) -> None:
+        with self._changed:
+            changed = self._active != active_id
+            self._active = active_id
+            self._changed.notify_all()
+        if changed:
+            for listener in self._listeners:
+                listener(active_id)
+
+    def _start_tracking(self, active_id: Optional[int]) -> None:
+        if active_id is not None:
+            self._set(active_id)
+        self._tracking = True
+
+    def _stop_tracking(self) -> None:
+        self._tracking = False
+
+
+def format_id(xid: int, format: IdFormat):
+    """
+    Formats a native X id. Only needed at the edges (bspc, logs).
+    """
+    if format == IdFormat.HEX8:
+        return f'0x{xid:08x}'
+    if format == IdFormat.HEX:
+        return hex(xid)
+    return xid
 
 
 class WMWindow:
-    def __init__(self, *, wmctrl_data: wmctrl.Window):
-        self._data = wmctrl_data 
+    """
+    Compact window record keyed by the native integer X id.
+    """
+    __slots__ = ("id", "desktop", "pid", "x", "y", "w", "h",
+                 "wm_class", "host", "wm_name", "wm_window_role", "wm_state")
+
+    def __init__(self, id: int, *, desktop: int = -1, pid: int = 0,
+                 x: int = 0, y: int = 0, w: int = 0, h: int = 0,
+                 wm_class: str = "", host: str = "", wm_name: str = "",
+                 wm_window_role: str = "", wm_state: Tuple[str, ...] = ()):
+        self.id = id
+        self.desktop = desktop
+        self.pid = pid
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.wm_class = wm_class
+        self.host = host
+        self.wm_name = wm_name
+        self.wm_window_role = wm_window_role
+        self.wm_state = wm_state
+
+    def _set_from(self, other: "WMWindow") -> bool:
+        """
+        Updates the window in place. Returns True if anything changed.
+        """
+        changed = False
+        for field in self.__slots__:
+            value = getattr(other, field)
+            if getattr(self, field) != value:
+                setattr(self, field, value)
+                changed = True
+        return changed
 
     def get_id(self, format: Union[IdFormat, None] = None):
         if format is not None:
-            return IdConverter.convert([self.get_id()], input=IdFormat.HEX8, output=format)[0]
+            return format_id(self.id, format)
 
-        return self._data.id
+        return self.id
     
     def get_desktop(self):
-        return self._data.desktop
+        return self.desktop
 
     def get_x(self):
-        return self._data.x
+        return self.x
 
     def get_y(self):
-        return self._data.y
+        return self.y
 
     def get_w(self):
-        return self._data.w
+        return self.w
 
     def get_h(self):
-        return self._data.h
+        return self.h
 
     def get_name(self):
-        return self._data.wm_name
+        return self.wm_name
 
     def get_class(self):
-        return self._data.wm_class
+        return self.wm_class
 
-    def get_active(self):
-        return self.get_id(format=IdFormat.HEX8) == get_active(format=IdFormat.HEX8) 
+    def get_pid(self):
+        return self.pid
 
-    # def get_host(self):
-    #     return self.host
-    #
-    # def get_wm_window_role(self):
-    #     return self._wm_window_role
-    #
-    # def get_wm_state(self):
-    #     return self._wm_state
+    def get_host(self):
+        return self.host
 
-    def __str__(self):
+    def get_wm_window_role(self):
+        return self.wm_window_role
+
+    def get_wm_state(self):
+        return self.wm_state
+
+    def get_active(self, active_id: int):
+        return self.id == active_id
+
+    def describe(self, active_id: Optional[int] = None) -> str:
+        """
+        One line summary; with `active_id` it also says whether this is the
+        active window.
+        """
         msg = ""
-        msg += f"id={self.get_id()}"
+        msg += f"id={self.get_id(IdFormat.HEX8)}"
         msg += f", desktop={self.get_desktop()}"
         msg += f", x={self.get_x()}"
         msg += f", y={self.get_y()}"
@@ -126,19 +207,87 @@ class WMWindow:
         msg += f", h={self.get_h()}"
         msg += f", wm_name={self.get_name()}"
         msg += f", wm_class={self.get_class()}"
-        msg += f", active={self.get_active()}"
+        if active_id is not None:
+            msg += f", active={self.get_active(active_id)}"
         # msg += f", host={self.host}"
         # msg += f", _wm_window_role={self._wm_window_role}"
         # msg += f", _wm_state={self._wm_state}"
         return msg
 
+    def __str__(self):
+        return self.describe()
+
+
+WindowCallback = Callable[[WMWindow], None]
+
 
 class WindowManager:
-    def __init__(self):
-        self.windows = {}
+    CONFIRM_FOCUS_TIMEOUT = 0.1
+
+    def __init__(self, backend: "WMBackend", event_driven: bool = False,
+                 clock: Clock = system_clock):
+        self.windows: Dict[int, WMWindow] = {}
+        # Índices: wm_name -> ids, wm_class -> ids. Se mantienen junto a self.windows
+        self._by_name: Dict[str, Set[int]] = {}
+        self._by_class: Dict[str, Set[int]] = {}
         self._updating = False
+        self._on_added: List[WindowCallback] = []
+        self._on_removed: List[WindowCallback] = []
+        self._on_changed: List[WindowCallback] = []
+        self._lock = threading.RLock()
+        self._backend = backend
+        self._events_running = False
+        self._event_driven = event_driven
+        self.active = ActiveWindowTracker(backend, clock)
+
+    @property
+    def event_driven(self) -> bool:
+        return self._event_driven
+
+    @property
+    def backend(self) -> "WMBackend":
+        return self._backend
+
+    def subscribe(self, *,
+                  on_added: Optional[WindowCallback] = None,
+                  on_removed: Optional[WindowCallback] = None,
+                  on_changed: Optional[WindowCallback] = None) -> None:
+        """
+        Registers callbacks for registry changes. They run in the thread that
+        updated the registry (the caller of update() or the X events thread).
+        """
+        if on_added is not None:
+            self._on_added.append(on_added)
+        if on_removed is not None:
+            self._on_removed.append(on_removed)
+        if on_changed is not None:
+            self._on_changed.append(on_changed)
+
+    def start_events(self) -> bool:
+        """
+        Switches the registry to backend events. From now on update() is a no-op.
+        Returns False if events are disabled or the backend has none.
+        """
+        if not self._event_driven:
+            return False
+        if not self._events_running:
+            self._events_running = self._backend.start_events(self)
+        return self._events_running
+
+    def process_events(self, timeout: float = 0.5) -> None:
+        if self._events_running:
+            self._backend.process_events(timeout)
+
+    def stop_events(self) -> None:
+        if self._events_running:
+            self._backend.stop_events()
+            self._events_running = False
 
     def update(self) -> None:
+        # Con eventos el registro ya está al día
+        if self._events_running:
+            return
+
         try:
             # print(f"Invocamos a update WindowManager")
             if self._updating:
@@ -147,11 +296,14 @@ class WindowManager:
         
             self._updating = True
             # Intentar obtener la lista de ventanas
-            found_windows = wmctrl.Window.list()
+            found = self._backend.list_windows()
             
-            self.windows.clear()  # Limpiar el diccionario actual de ventanas
-            for wmctrl_data in found_windows:
-                self.windows[wmctrl_data.id] = WMWindow(wmctrl_data=wmctrl_data)
+            # Actualización incremental: solo se tocan las ventanas que cambian
+            found_ids = {window.id for window in found}
+            for window_id in set(self.ids()) - found_ids:
+                self._remove(window_id)
+            for window in found:
+                self._store(window)
 
             # print(f"actualizado con {found_windows}")
 
@@ -161,32 +313,146 @@ class WindowManager:
         finally:
             self._updating = False
 
-    def find(self, tid: Optional[str] = None, tname: Optional[str] = None, tclass: Optional[str] = None) -> List[str]:
-        result = []
-        
-        for window in self.windows.values():
-            window_id = window.get_id()
-            window_name = window.get_name()
-            window_class = window.get_class()
+    def _store(self, new_window: WMWindow) -> None:
+        """
+        Adds the window or updates the existing WMWindow in place.
+        """
+        with self._lock:
+            window = self.windows.get(new_window.id)
+            if window is None:
+                window = new_window
+                self.windows[window.id] = window
+                self._index(window)
+                callbacks = self._on_added
+            else:
+                old_key = (window.wm_name, window.wm_class)
+                if not window._set_from(new_window):
+                    return
+                if old_key != (window.wm_name, window.wm_class):
+                    self._unindex(self._by_name, old_key[0], window.id)
+                    self._unindex(self._by_class, old_key[1], window.id)
+                    self._index(window)
+                callbacks = self._on_changed
+
+        self._notify(callbacks, window)
+
+    def _set_geometry(self, window_id: int, x: Optional[int], y: Optional[int],
+                      w: int, h: int) -> None:
+        """
+        Updates only the geometry of a known window; x/y None keeps them.
+        """
+        with self._lock:
+            window = self.windows.get(window_id)
+            if window is None:
+                return
+            geometry = (window.x if x is None else x, window.y if y is None else y, w, h)
+            if geometry == (window.x, window.y, window.w, window.h):
+                return
+            window.x, window.y, window.w, window.h = geometry
+
+        self._notify(self._on_changed, window)
+
+    def _remove(self, window_id: int) -> None:
+        with self._lock:
+            window = self.windows.pop(window_id, None)
+            if window is None:
+                return
+            self._unindex(self._by_name, window.wm_name, window_id)
+            self._unindex(self._by_class, window.wm_class, window_id)
 
-            if tid is not None and window_id != tid:
-                continue
-            if tname is not None and window_name != tname:
-                continue
-            if tclass is not None and window_class != tclass:
-                continue 
-            result.append(window_id)
+        self._notify(self._on_removed, window)
 
-        return result
+    def _index(self, window: WMWindow) -> None:
+        self._by_name.setdefault(window.wm_name, set()).add(window.id)
+        self._by_class.setdefault(window.wm_class, set()).add(window.id)
+
+    @staticmethod
+    def _notify(callbacks: List[WindowCallback], window: WMWindow) -> None:
+        for callback in callbacks:
+            try:
+                callback(window)
+            except Exception as e:
+                print(f"Error in window callback {callback}: {e}")
+
+    @staticmethod
+    def _unindex(index: Dict[str, Set[int]], key: str, window_id: int) -> None:
+        ids = index.get(key)
+        if ids is None:
+            return
+        ids.discard(window_id)
+        if not ids:
+            del index[key]
+
+    def ids(self) -> List[int]:
+        with self._lock:
+            return list(self.windows.keys())
+
+    def find(self, tid: Optional[int] = None, tname: Optional[str] = None, tclass: Optional[str] = None) -> List[int]:
+        """
+        Returns the ids matching every given filter. Each filter is a hash lookup.
+        """
+        with self._lock:
+            candidates: Optional[Set[int]] = None
+
+            if tid is not None:
+                candidates = {tid} if tid in self.windows else set()
+            if tname is not None:
+                candidates = self._narrow(candidates, self._by_name.get(tname))
+            if tclass is not None:
+                candidates = self._narrow(candidates, self._by_class.get(tclass))
+
+            if candidates is None:
+                return list(self.windows.keys())
+            return list(candidates)
+
+    @staticmethod
+    def _narrow(candidates: Optional[Set[int]], ids: Optional[Set[int]]) -> Set[int]:
+        if not ids:
+            return set()
+        if candidates is None:
+            return set(ids)
+        return candidates & ids
+
+    def alive(self, window_id: int) -> bool:
+        """
+        Cheap liveness check for a known id. With events running DestroyNotify
+        keeps the registry exact, so it's a dict lookup; otherwise it asks the
+        backend (one GetWindowAttributes on X).
+        """
+        if self._events_running:
+            return window_id in self
+        return self._backend.alive(window_id)
+
+    def focus(self, window_id: int) -> bool:
+        """
+        Focuses the window in process and confirms it from the active window
+        tracker. If that fails the backend gets a chance with its fallback
+        (bspc in a subprocess on bspwm).
+        """
+        hex_id = format_id(window_id, IdFormat.HEX8)
+        try:
+            if self._backend.request_focus(window_id) and \
+                    self.active.wait_for(window_id, self.CONFIRM_FOCUS_TIMEOUT):
+                return True
+        except Exception as e:
+            print(f"Error focusing window {hex_id}: {e}")
+
+        if not self._backend.fallback_focus(window_id):
+            return False
+        print(f"Focus de {hex_id} sin confirmar, usando el fallback de {self._backend.name}")
+        return self.active.wait_for(window_id, self.CONFIRM_FOCUS_TIMEOUT)
 
     def __getitem__(self, window_id):
         if window_id not in self.windows:
             raise KeyError(f"Window ID {window_id} not found.")
         return self.windows[window_id]
 
-    def get_active(self, format: IdFormat = IdFormat.HEX8):
-        # Assuming `get_active` is a function that gets the active window ID
-        return get_active(format)
+    def get_active(self, format: IdFormat = IdFormat.INT, refresh: bool = False):
+        """
+        Active window id. Served from memory while X events are running;
+        refresh=True forces a synchronous read.
+        """
+        return self.active.get(format, refresh)
 
     def __str__(self):
         msg = "[ WindowManager ]\n"
@@ -195,13 +461,15 @@ class WindowManager:
         msg += "active_window: "
         active_window = self.get_active()
         if active_window:
-            msg += f"{active_window}\n"
+            msg += f"{format_id(active_window, IdFormat.HEX8)}\n"
         else:
             msg += "None\n"
 
         # Window Data
-        for window_data in self.windows.values():
-            msg += f"[{window_data.__str__()}]\n"
+        with self._lock:
+            windows = list(self.windows.values())
+        for window_data in windows:
+            msg += f"[{window_data.describe(active_window)}]\n"
 
         return msg
 
@@ -210,6 +478,10 @@ class WindowManager:
 
 
 if __name__ == "__main__":
-    wm = WindowManager()
+    from src.sys_display import xconn
+    from src.wm_backend import create_backend
+
+    wm = WindowManager(create_backend("ewmh"))
     wm.update()
     print(wm)
+    print(xconn)
@@ -0,0 +1,135 @@
+from typing import Any, Deque, Dict, List, Optional
+from collections import OrderedDict, deque
+import json
+import os
+import threading
+from src.clock import Clock, system_clock
+
+"""
+Span tracing of user actions in Chrome trace-event JSON (chrome://tracing,
+Perfetto, speedscope).
+
+A trace is one user action (Enter in FFChat, a hotkey...) and its id is the
+TaskQueue sequence that carries its tasks. Every task adds two spans to it:
+the time queued (push -> start, Task.App.Wait delays included) and the
+handler run. The run is also drawn on the thread that executed it.
+
+Only the last MAX_TRACES actions and MAX_EVENTS events are kept, so a long
+session holds a bounded window and export() writes the most recent part.
+"""
+
+
+class Trace:
+    __slots__ = ("id", "name", "start", "end")
+
+    def __init__(self, trace_id: int, name: str, start: float):
+        self.id = trace_id
+        self.name = name
+        self.start = start
+        self.end = start
+
+
+class Tracer:
+    MAX_EVENTS = 20000
+    # Unas 3 tareas x 3 eventos por acción: del orden de MAX_EVENTS
+    MAX_TRACES = 2000
+
+    def __init__(self, clock: Clock = system_clock):
+        self.enabled = False
+        # El mismo reloj que pone TaskPacket.pushed_at (Vars.clock)
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Por orden de apertura; se descartan las más antiguas
+        self._traces: "OrderedDict[int, Trace]" = OrderedDict()
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=self.MAX_EVENTS)
+        self._pid = os.getpid()
+
+    def begin(self, trace_id: int, name: str, start: Optional[float] = None) -> None:
+        """
+        Opens the trace of a user action. `start` defaults to now, which is
+        the keypress when called from the event handlers.
+        """
+        if not self.enabled:
+            return
+        start = self.clock.time() if start is None else start
+        with self._lock:
+            self._add(Trace(trace_id, name, start))
+
+    def task(self, trace_id: int, name: str, pushed_at: float,
+             started_at: float, finished_at: float, failed: bool = False) -> None:
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                # Secuencia sin nombre (tareas sueltas, secuencia 0...)
+                trace = self._add(Trace(trace_id, f"sequence {trace_id}", pushed_at))
+            trace.end = max(trace.end, finished_at)
+
+            args = {"trace": trace_id, "failed": failed}
+            self._async(trace_id, f"queued {name}", "queue", pushed_at, started_at, args)
+            self._async(trace_id, name, "task", started_at, finished_at, args)
+            self._events.append({
+                "name": name, "cat": "task", "ph": "X",
+                "ts": self._us(started_at), "dur": self._us(finished_at - started_at),
+                "pid": self._pid, "tid": thread.name, "args": args,
+            })
+
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            events = list(self._events)
+            traces = list(self._traces.values())
+
+        for trace in traces:
+            # La acción completa: de la pulsación al final de su última tarea
+            args = {"trace": trace.id, "total_ms": round((trace.end - trace.start) * 1000, 3)}
+            events.append(self._async_event(trace.id, trace.name, "action", "b", trace.start, args))
+            events.append(self._async_event(trace.id, trace.name, "action", "e", trace.end, args))
+
+        # Con el mismo ts la acción abre antes y cierra después que sus hijos
+        def order(event: Dict[str, Any]):
+            if event["args"].get("kind") == "action":
+                return (event["ts"], 0 if event["ph"] == "b" else 2)
+            return (event["ts"], 1)
+
+        events.sort(key=order)
+        return events
+
+    def export(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+        print(f"Trazas guardadas en {path}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._traces.clear()
+            self._events.clear()
+
+    def _add(self, trace: Trace) -> Trace:
+        self._traces.pop(trace.id, None)
+        self._traces[trace.id] = trace
+        while len(self._traces) > self.MAX_TRACES:
+            self._traces.popitem(last=False)
+        return trace
+
+    def _async(self, trace_id: int, name: str, cat: str,
+               start: float, end: float, args: Dict[str, Any]) -> None:
+        self._events.append(self._async_event(trace_id, name, cat, "b", start, args))
+        self._events.append(self._async_event(trace_id, name, cat, "e", end, args))
+
+    def _async_event(self, trace_id: int, name: str, cat: str, ph: str,
+                     ts: float, args: Dict[str, Any]) -> Dict[str, Any]:
+        # Mismo id y cat "action" en todos para que el visor los anide en una pista
+        return {
+            "name": name, "cat": "action", "ph": ph, "id": trace_id,
+            "ts": self._us(ts), "pid": self._pid, "tid": "actions",
+            "args": dict(args, kind=cat),
+        }
+
+    @staticmethod
+    def _us(seconds: float) -> float:
+        return round(seconds * 1_000_000, 1)
+
+
+tracer = Tracer()
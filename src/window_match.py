@@ -0,0 +1,132 @@
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+from difflib import SequenceMatcher
+from enum import Enum
+import fnmatch
+import re
+import threading
+from src.sys_window import WindowManager, WMWindow
+
+
+class MatchKind(Enum):
+    EXACT = "exact"
+    REGEX = "re"
+    GLOB = "glob"
+    FUZZY = "fuzzy"
+
+
+class MatchRule:
+    """
+    One condition on a window field, compiled once.
+
+    Patterns may carry the kind as a prefix: "re:FINAL FANTASY.*",
+    "glob:*FINAL FANTASY*", "fuzzy:final fantasy xiv". Without prefix the
+    match is exact.
+    """
+    FIELDS = ("name", "class", "pid", "role")
+    FUZZY_THRESHOLD = 0.8
+
+    def __init__(self, field: str, pattern: Union[str, int], kind: Optional[MatchKind] = None):
+        if field not in self.FIELDS:
+            raise ValueError(f"Unknown match field: {field}")
+
+        if kind is None:
+            kind, pattern = self._split_prefix(pattern)
+
+        self.field = field
+        self.kind = kind
+        self.pattern = pattern
+        self._test = self._compile(kind, pattern)
+
+    @staticmethod
+    def _split_prefix(pattern: Union[str, int]) -> Tuple[MatchKind, Union[str, int]]:
+        if isinstance(pattern, str):
+            prefix, sep, rest = pattern.partition(":")
+            if sep:
+                for kind in MatchKind:
+                    if kind.value == prefix:
+                        return kind, rest
+        return MatchKind.EXACT, pattern
+
+    def _compile(self, kind: MatchKind, pattern: Union[str, int]) -> Callable[[object], bool]:
+        if kind == MatchKind.EXACT:
+            return lambda value: value == pattern
+        if kind == MatchKind.REGEX:
+            regex = re.compile(str(pattern))
+            return lambda value: regex.search(str(value)) is not None
+        if kind == MatchKind.GLOB:
+            regex = re.compile(fnmatch.translate(str(pattern)))
+            return lambda value: regex.match(str(value)) is not None
+
+        wanted = str(pattern).lower()
+        return lambda value: SequenceMatcher(None, wanted, str(value).lower()).ratio() >= self.FUZZY_THRESHOLD
+
+    def value(self, window: WMWindow):
+        if self.field == "name":
+            return window.wm_name
+        if self.field == "class":
+            return window.wm_class
+        if self.field == "pid":
+            return window.pid
+        return window.wm_window_role
+
+    def matches(self, window: WMWindow) -> bool:
+        return self._test(self.value(window))
+
+    def __str__(self):
+        return f"{self.field} {self.kind.value} {self.pattern!r}"
+
+
+class WindowMatcher:
+    """
+    Keeps the set of windows matching every rule, evaluated incrementally from
+    WindowManager callbacks. Results are cached per window id and only
+    re-evaluated when one of the fields the rules look at changes.
+    """
+    def __init__(self, rules: List[MatchRule]):
+        self.rules = rules
+        self._cache: Dict[int, Tuple[tuple, bool]] = {}
+        self._matched: Set[int] = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_args(cls, tname=None, tclass=None, tpid=None, trole=None) -> "WindowMatcher":
+        rules = []
+        for field, pattern in (("name", tname), ("class", tclass), ("pid", tpid), ("role", trole)):
+            if pattern is not None:
+                rules.append(MatchRule(field, pattern))
+        return cls(rules)
+
+    def attach(self, wm: WindowManager) -> None:
+        wm.subscribe(on_added=self.evaluate, on_changed=self.evaluate, on_removed=self.forget)
+        for window_id in wm.ids():
+            if window_id in wm:
+                self.evaluate(wm[window_id])
+
+    def evaluate(self, window: WMWindow) -> bool:
+        key = tuple(rule.value(window) for rule in self.rules)
+        with self._lock:
+            cached = self._cache.get(window.id)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+
+        result = all(rule.matches(window) for rule in self.rules)
+
+        with self._lock:
+            self._cache[window.id] = (key, result)
+            if result:
+                self._matched.add(window.id)
+            else:
+                self._matched.discard(window.id)
+        return result
+
+    def forget(self, window: WMWindow) -> None:
+        with self._lock:
+            self._cache.pop(window.id, None)
+            self._matched.discard(window.id)
+
+    def matched(self) -> List[int]:
+        with self._lock:
+            return list(self._matched)
+
+    def __str__(self):
+        return " and ".join(str(rule) for rule in self.rules)
@@ -0,0 +1,198 @@
+from typing import Dict, List, Optional
+from abc import ABC, abstractmethod
+import threading
+from src.clock import Clock, system_clock
+from src.sys_window import WMWindow
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    from src.sys_window import WindowManager
+
+
+class WMBackend(ABC):
+    """
+    Everything WindowManager needs from the window manager / display server.
+
+    The X backends live in src/wm_backend_x.py and are imported lazily by
+    create_backend(), so the fake one works without python-xlib or a WM.
+    """
+    name = "base"
+
+    @abstractmethod
+    def list_windows(self) -> List[WMWindow]:
+        pass
+
+    @abstractmethod
+    def get_active(self) -> int:
+        pass
+
+    @abstractmethod
+    def alive(self, xid: int) -> bool:
+        pass
+
+    @abstractmethod
+    def request_focus(self, xid: int) -> bool:
+        """
+        Asks for the focus change in process. Returns True if it was sent;
+        WindowManager confirms it through the active window tracker.
+        """
+        pass
+
+    def fallback_focus(self, xid: int) -> bool:
+        """
+        Slower focus path used when request_focus() can't be confirmed.
+        Returns False if the backend has none.
+        """
+        return False
+
+    def start_events(self, wm: "WindowManager") -> bool:
+        """
+        Starts feeding `wm` (registry and active window) from events.
+        Returns False if the backend has no events.
+        """
+        return False
+
+    def process_events(self, timeout: float) -> None:
+        pass
+
+    def stop_events(self) -> None:
+        pass
+
+
+class FakeBackend(WMBackend):
+    """
+    In-memory window manager for benchmarks and load tests.
+
+    `latency` is added to every call that would be a round trip on X.
+    Focus changes are applied `focus_delay` seconds after the request, as a
+    real WM does asynchronously. Both are measured on `clock`, so with a
+    SimulatedClock they take no real time.
+    """
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, focus_delay: float = 0.0,
+                 clock: Clock = system_clock):
+        self.latency = latency
+        self.focus_delay = focus_delay
+        self.clock = clock
+        self._windows: Dict[int, WMWindow] = {}
+        self._active = 0
+        self._next_id = 0x01000001
+        self._lock = threading.Lock()
+        self._wm: Optional["WindowManager"] = None
+        self._stopped = threading.Event()
+        self.calls: Dict[str, int] = {}
+
+    # Simulación
+
+    def create_window(self, wm_name: str, wm_class: str = "fake.Fake",
+                      xid: Optional[int] = None, **kwargs) -> int:
+        """
+        `xid` registers a window that already exists elsewhere (our own Qt
+        window) instead of making up an id.
+        """
+        with self._lock:
+            if xid is None:
+                xid = self._next_id
+                self._next_id += 1
+            window = WMWindow(xid, wm_name=wm_name, wm_class=wm_class, **kwargs)
+            self._windows[xid] = window
+        if self._wm is not None:
+            self._wm._store(self._copy(window))
+        return xid
+
+    def destroy_window(self, xid: int) -> None:
+        with self._lock:
+            self._windows.pop(xid, None)
+            if self._active == xid:
+                self._active = 0
+        if self._wm is not None:
+            self._wm._remove(xid)
+            self._wm.active._set(self._active)
+
+    def rename_window(self, xid: int, wm_name: str) -> None:
+        with self._lock:
+            window = self._windows[xid]
+            window.wm_name = wm_name
+        if self._wm is not None:
+            self._wm._store(self._copy(window))
+
+    def set_active(self, xid: int) -> None:
+        with self._lock:
+            self._active = xid
+        if self._wm is not None:
+            self._wm.active._set(xid)
+
+    # WMBackend
+
+    def list_windows(self) -> List[WMWindow]:
+        self._round_trip("list_windows")
+        with self._lock:
+            return [self._copy(window) for window in self._windows.values()]
+
+    def get_active(self) -> int:
+        self._round_trip("get_active")
+        with self._lock:
+            return self._active
+
+    def alive(self, xid: int) -> bool:
+        self._round_trip("alive")
+        with self._lock:
+            return xid in self._windows
+
+    def request_focus(self, xid: int) -> bool:
+        self._round_trip("request_focus")
+        with self._lock:
+            if xid not in self._windows:
+                return False
+        if self.focus_delay > 0:
+            self.clock.call_later(self.focus_delay, lambda: self.set_active(xid))
+        else:
+            self.set_active(xid)
+        return True
+
+    def start_events(self, wm: "WindowManager") -> bool:
+        self._wm = wm
+        self._stopped.clear()
+        for window in self.list_windows():
+            wm._store(window)
+        wm.active._start_tracking(self.get_active())
+        return True
+
+    def process_events(self, timeout: float) -> None:
+        # Los cambios se aplican al momento; aquí solo se espera
+        self._stopped.wait(timeout)
+
+    def stop_events(self) -> None:
+        if self._wm is not None:
+            self._wm.active._stop_tracking()
+        self._wm = None
+        self._stopped.set()
+
+    def _round_trip(self, call: str) -> None:
+        self.calls[call] = self.calls.get(call, 0) + 1
+        if self.latency > 0:
+            self.clock.sleep(self.latency)
+
+    @staticmethod
+    def _copy(window: WMWindow) -> WMWindow:
+        copy = WMWindow(window.id)
+        copy._set_from(window)
+        return copy
+
+
+def create_backend(name: str, clock: Clock = system_clock, **kwargs) -> WMBackend:
+    """
+    Backend by name: "bspwm", "ewmh" or "fake". Only the fake one runs on
+    `clock`; the X ones talk to a real server.
+    """
+    if name == "fake":
+        return FakeBackend(clock=clock, **kwargs)
+
+    from src.wm_backend_x import BspwmBackend, EWMHBackend
+    if name == "bspwm":
+        return BspwmBackend(**kwargs)
+    if name == "ewmh":
+        return EWMHBackend(**kwargs)
+    raise ValueError(f"Unknown window manager backend: {name}")
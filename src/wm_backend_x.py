@@ -0,0 +1,332 @@
+from typing import List, Optional, Set
+import os
+import select
+import socket
+import subprocess
+import wmctrl
+import Xlib.error
+import Xlib.protocol.event
+import Xlib.X
+from src.sys_display import XConnection, xconn
+from src.sys_window import WMWindow
+from src.wm_backend import WMBackend
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    from src.sys_window import WindowManager
+
+
+def window_from_wmctrl(wmctrl_data: wmctrl.Window) -> WMWindow:
+    return WMWindow(
+        int(wmctrl_data.id, 16),
+        desktop=wmctrl_data.desktop,
+        pid=wmctrl_data.pid,
+        x=wmctrl_data.x,
+        y=wmctrl_data.y,
+        w=wmctrl_data.w,
+        h=wmctrl_data.h,
+        wm_class=wmctrl_data.wm_class,
+        host=wmctrl_data.host,
+        wm_name=wmctrl_data.wm_name,
+        wm_window_role=wmctrl_data.wm_window_role,
+        wm_state=tuple(wmctrl_data.wm_state),
+    )
+
+
+class WindowEvents:
+    """
+    Keeps a WindowManager registry current from X events instead of wmctrl polling.
+
+    It owns a dedicated display connection: _NET_CLIENT_LIST changes on the root
+    window add/remove clients, PropertyNotify on a client refreshes it and
+    DestroyNotify drops it. ConfigureNotify only updates the geometry, taken
+    from the event itself.
+    """
+    CLIENT_EVENT_MASK = Xlib.X.PropertyChangeMask | Xlib.X.StructureNotifyMask
+    WATCHED_PROPERTIES = ("_NET_WM_NAME", "WM_NAME", "WM_CLASS", "_NET_WM_DESKTOP", "_NET_WM_STATE")
+
+    def __init__(self, wm: "WindowManager"):
+        self._wm = wm
+        self._conn: XConnection = xconn.open("window-events")
+        self._disp = self._conn.display
+        self._root = self._conn.root
+        self._atom = {name: self._conn.atom(name) for name in (
+            "_NET_CLIENT_LIST", "_NET_ACTIVE_WINDOW", "_NET_WM_NAME", "_NET_WM_DESKTOP", "_NET_WM_PID",
+            "_NET_WM_STATE", "UTF8_STRING", "WM_WINDOW_ROLE",
+        )}
+        self._watched = {self._conn.atom(name) for name in self.WATCHED_PROPERTIES}
+        # Clientes dentro de un marco del WM: sus ConfigureNotify reales traen
+        # coordenadas relativas al marco, no a la raíz
+        self._framed: Set[int] = set()
+
+    def start(self) -> None:
+        with self._conn.timed("ChangeWindowAttributes"):
+            self._root.change_attributes(event_mask=Xlib.X.PropertyChangeMask)
+        self.sync_client_list()
+        self._wm.active._start_tracking(self._read_active())
+
+    def stop(self) -> None:
+        self._wm.active._stop_tracking()
+        xconn.close(self._conn)
+
+    def process(self, timeout: float) -> None:
+        """
+        Waits up to `timeout` seconds for X events and handles every pending one.
+        """
+        if not self._disp.pending_events():
+            readable, _, _ = select.select([self._disp.fileno()], [], [], timeout)
+            if not readable:
+                return
+
+        # pending_events() lee del socket, por eso se llama en cada vuelta
+        while self._disp.pending_events():
+            self._handle(self._disp.next_event())
+
+    def _handle(self, event) -> None:
+        if event.type == Xlib.X.DestroyNotify:
+            self._framed.discard(event.window.id)
+            self._wm._remove(event.window.id)
+        elif event.type == Xlib.X.ConfigureNotify:
+            self._configure(event)
+        elif event.type == Xlib.X.ReparentNotify:
+            if event.parent.id == self._root.id:
+                self._framed.discard(event.window.id)
+            else:
+                self._framed.add(event.window.id)
+        elif event.type == Xlib.X.PropertyNotify:
+            if event.window.id == self._root.id:
+                if event.atom == self._atom["_NET_CLIENT_LIST"]:
+                    self.sync_client_list()
+                elif event.atom == self._atom["_NET_ACTIVE_WINDOW"]:
+                    active_id = self._read_active()
+                    if active_id is not None:
+                        self._wm.active._set(active_id)
+            elif event.atom in self._watched:
+                self._refresh(event.window.id)
+
+    def sync_client_list(self) -> None:
+        with self._conn.timed("GetProperty"):
+            prop = self._root.get_full_property(self._atom["_NET_CLIENT_LIST"], Xlib.X.AnyPropertyType)
+        client_ids = set(prop.value) if prop is not None else set()
+        known_ids = set(self._wm.ids())
+
+        for xid in known_ids - client_ids:
+            self._framed.discard(xid)
+            self._wm._remove(xid)
+
+        # ChangeWindowAttributes no tiene respuesta: el BadWindow de una
+        # ventana ya destruida llega después, así que se recoge con un sync
+        new_ids = client_ids - known_ids
+        errors = {}
+        for xid in new_ids:
+            window = self._disp.create_resource_object("window", xid)
+            errors[xid] = Xlib.error.CatchError(Xlib.error.BadWindow)
+            window.change_attributes(event_mask=self.CLIENT_EVENT_MASK, onerror=errors[xid])
+        if new_ids:
+            with self._conn.timed("ChangeWindowAttributes"):
+                self._disp.sync()
+        for xid in new_ids:
+            if errors[xid].get_error() is None:
+                self._refresh(xid)
+
+    def _configure(self, event) -> None:
+        xid = event.window.id
+        if event.send_event or xid not in self._framed:
+            # Sintético (ICCCM 4.2.3) o sin marco: coordenadas de la raíz
+            self._wm._set_geometry(xid, event.x + event.border_width,
+                                   event.y + event.border_width, event.width, event.height)
+        else:
+            self._wm._set_geometry(xid, None, None, event.width, event.height)
+
+    def _read_active(self) -> Optional[int]:
+        with self._conn.timed("GetProperty"):
+            prop = self._root.get_full_property(self._atom["_NET_ACTIVE_WINDOW"], Xlib.X.AnyPropertyType)
+        if prop is None or not len(prop.value):
+            return None
+        # 0 significa que no hay ninguna ventana activa
+        return int(prop.value[0])
+
+    def _refresh(self, xid: int) -> None:
+        # Varias peticiones (geometría, propiedades); se cuentan como una lectura
+        with self._conn.timed("ReadWindow"):
+            window = self._read(xid)
+        if window is not None:
+            self._wm._store(window)
+
+    def _read(self, xid: int) -> Optional[WMWindow]:
+        """
+        Builds the same record `wmctrl -l -G -p -x` would give for the window.
+        """
+        window = self._disp.create_resource_object("window", xid)
+        try:
+            geometry = window.get_geometry()
+            coords = window.translate_coords(self._root, 0, 0)
+            wm_class = window.get_wm_class()
+            desktop = self._cardinal(window, "_NET_WM_DESKTOP")
+            pid = self._cardinal(window, "_NET_WM_PID")
+            state = window.get_full_property(self._atom["_NET_WM_STATE"], Xlib.X.AnyPropertyType)
+            if (geometry.x + geometry.border_width, geometry.y + geometry.border_width) != (-coords.x, -coords.y):
+                self._framed.add(xid)
+            else:
+                self._framed.discard(xid)
+            return WMWindow(
+                xid,
+                desktop=-1 if desktop is None else desktop,
+                pid=0 if pid is None else pid,
+                x=-coords.x,
+                y=-coords.y,
+                w=geometry.width,
+                h=geometry.height,
+                wm_class=".".join(wm_class) if wm_class else "N/A",
+                host=window.get_wm_client_machine() or "N/A",
+                wm_name=self._name(window),
+                wm_window_role=self._text(window, self._atom["WM_WINDOW_ROLE"]),
+                wm_state=tuple(self._disp.get_atom_name(a) for a in state.value) if state else (),
+            )
+        except (Xlib.error.BadWindow, Xlib.error.BadDrawable):
+            # La ventana ha desaparecido antes de poder leerla
+            return None
+
+    def _name(self, window) -> str:
+        prop = window.get_full_property(self._atom["_NET_WM_NAME"], self._atom["UTF8_STRING"])
+        if prop is not None:
+            return prop.value.decode("utf-8", "replace")
+        return window.get_wm_name() or ""
+
+    def _text(self, window, atom: int) -> str:
+        prop = window.get_full_property(atom, Xlib.X.AnyPropertyType)
+        if prop is None:
+            return ""
+        value = prop.value
+        return value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+
+    def _cardinal(self, window, name: str) -> Optional[int]:
+        prop = window.get_full_property(self._atom[name], Xlib.X.AnyPropertyType)
+        if prop is None or not len(prop.value):
+            return None
+        return int(prop.value[0])
+
+
+class BspwmSocket:
+    """
+    Talks to bspwm through its socket, the same way bspc does, without the fork/exec.
+    """
+    FAILURE_MESSAGE = b"\x07"
+
+    def __init__(self):
+        self.path = os.environ.get("BSPWM_SOCKET") or self._default_path()
+
+    @staticmethod
+    def _default_path() -> str:
+        # Mismo formato que bspwm: /tmp/bspwm<host>_<display>_<screen>-socket
+        display = os.environ.get("DISPLAY", ":0")
+        host, _, rest = display.partition(":")
+        number, _, screen = rest.partition(".")
+        return f"/tmp/bspwm{host}_{number or 0}_{screen or 0}-socket"
+
+    def available(self) -> bool:
+        return os.path.exists(self.path)
+
+    def send(self, *args: str) -> bool:
+        message = b"".join(arg.encode() + b"\0" for arg in args)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(0.5)
+            sock.connect(self.path)
+            sock.sendall(message)
+            reply = b""
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                reply += chunk
+        return not reply.startswith(self.FAILURE_MESSAGE)
+
+
+class EWMHBackend(WMBackend):
+    """
+    Any EWMH compliant window manager: wmctrl listing, _NET_ACTIVE_WINDOW for
+    the active window and focus, and WindowEvents for the registry.
+    """
+    name = "ewmh"
+
+    def __init__(self):
+        self._events: Optional[WindowEvents] = None
+
+    def list_windows(self) -> List[WMWindow]:
+        return [window_from_wmctrl(wmctrl_data) for wmctrl_data in wmctrl.Window.list()]
+
+    def get_active(self) -> int:
+        conn = xconn.get()
+        net_active_window = conn.atom("_NET_ACTIVE_WINDOW")
+        with conn.timed("GetProperty"):
+            prop = conn.root.get_full_property(net_active_window, Xlib.X.AnyPropertyType)
+        if prop is not None and len(prop.value) and prop.value[0]:
+            return int(prop.value[0])
+
+        # WM sin soporte EWMH: nos quedamos con el foco de entrada
+        with conn.timed("GetInputFocus"):
+            return conn.display.get_input_focus().focus.id
+
+    def alive(self, xid: int) -> bool:
+        conn = xconn.get()
+        window = conn.display.create_resource_object("window", xid)
+        try:
+            with conn.timed("GetWindowAttributes"):
+                window.get_attributes()
+        except (Xlib.error.BadWindow, Xlib.error.BadDrawable):
+            return False
+        return True
+
+    def request_focus(self, xid: int) -> bool:
+        conn = xconn.get()
+        window = conn.display.create_resource_object("window", xid)
+        # source indication 2: petición de un pager, los WM no la filtran
+        message = Xlib.protocol.event.ClientMessage(
+            window=window,
+            client_type=conn.atom("_NET_ACTIVE_WINDOW"),
+            data=(32, [2, Xlib.X.CurrentTime, 0, 0, 0]),
+        )
+        with conn.timed("SendEvent"):
+            conn.root.send_event(
+                message,
+                event_mask=Xlib.X.SubstructureRedirectMask | Xlib.X.SubstructureNotifyMask,
+            )
+            conn.display.flush()
+        return True
+
+    def start_events(self, wm: "WindowManager") -> bool:
+        if self._events is None:
+            self._events = WindowEvents(wm)
+            self._events.start()
+        return True
+
+    def process_events(self, timeout: float) -> None:
+        if self._events is not None:
+            self._events.process(timeout)
+
+    def stop_events(self) -> None:
+        if self._events is not None:
+            self._events.stop()
+            self._events = None
+
+
+class BspwmBackend(EWMHBackend):
+    """
+    EWMH plus bspwm specifics: focus through the bspwm socket and, as a
+    fallback, `bspc node <id> -f` in a subprocess.
+    """
+    name = "bspwm"
+
+    def __init__(self):
+        super().__init__()
+        self._bspwm = BspwmSocket()
+
+    def request_focus(self, xid: int) -> bool:
+        if not self._bspwm.available():
+            return super().request_focus(xid)
+        return self._bspwm.send("node", hex(xid), "-f")
+
+    def fallback_focus(self, xid: int) -> bool:
+        subprocess.run(["bspc", "node", hex(xid), "-f"])
+        return True
@@ -0,0 +1,160 @@
+from typing import Dict, List, Optional, Tuple
+from Xlib import X, XK
+from Xlib.ext import xtest
+from src.clock import Clock, system_clock
+from src.sys_display import XConnection, xconn
+
+"""
+Types text with XTest fake key events, without going through the clipboard.
+
+Characters already in the keyboard map are typed with their keycode (plus
+Shift/AltGr when they are on another level). Anything else (CJK, symbols
+the layout lacks) is typed by temporarily remapping spare keycodes, the
+ones with no keysym, to the Unicode keysym (0x01000000 + codepoint). The
+remapped keycodes are restored when the text is done.
+
+Events are sent in batches and flushed once per batch; between batches
+that remap keys there is a short pause so clients can process the
+MappingNotify before the keys that use the new mapping arrive.
+"""
+
+
+UNICODE_KEYSYM = 0x01000000
+SPECIAL_KEYSYMS: Dict[str, str] = {"\n": "Return", "\t": "Tab", " ": "space"}
+
+
+def keysym_for_char(char: str) -> int:
+    name = SPECIAL_KEYSYMS.get(char)
+    if name is not None:
+        return XK.string_to_keysym(name)
+    codepoint = ord(char)
+    # Latin-1: el keysym es el propio código
+    if 0x20 <= codepoint <= 0x7e or 0xa0 <= codepoint <= 0xff:
+        return codepoint
+    return UNICODE_KEYSYM + codepoint
+
+
+class XTestTyper:
+    # Nivel de cada tecla en _lookup: 0 normal, 1 Shift, 2 AltGr
+    BATCH = 32
+    REMAP_SETTLE = 0.01
+
+    def __init__(self, conn: Optional[XConnection] = None, clock: Clock = system_clock):
+        self._conn = conn
+        self._clock = clock
+        self._spares: Optional[List[int]] = None
+        self._keysyms_per_keycode = 0
+
+    @property
+    def conn(self) -> XConnection:
+        # Sin conexión propia se usa la del hilo que escribe
+        return self._conn if self._conn is not None else xconn.get()
+
+    def type(self, text: str) -> int:
+        """
+        Types `text` into the focused window. Returns the number of
+        characters sent.
+        """
+        if not text:
+            return 0
+        conn = self.conn
+        display = conn.display
+        shift = display.keysym_to_keycode(XK.XK_Shift_L)
+        altgr = display.keysym_to_keycode(XK.XK_ISO_Level3_Shift)
+        spares = self._spare_keycodes(conn)
+        remapped: Dict[int, List[int]] = {}
+        sent = 0
+
+        try:
+            for batch in self._batches(text, len(spares) or 1):
+                keys: List[Tuple[int, int]] = []
+                mapped: Dict[int, int] = {}
+                for char in batch:
+                    keysym = keysym_for_char(char)
+                    keycode, level = self._lookup(display, keysym)
+                    if keycode == 0:
+                        keycode = mapped.get(keysym, 0)
+                        if keycode == 0:
+                            if len(mapped) >= len(spares):
+                                print(f"XTestTyper: no hay keycodes libres para {char!r}")
+                                continue
+                            keycode = spares[len(mapped)]
+                            mapped[keysym] = keycode
+                        level = 0
+                    keys.append((keycode, level))
+
+                if mapped:
+                    for keysym, keycode in mapped.items():
+                        if keycode not in remapped:
+                            remapped[keycode] = self._current(display, keycode)
+                        self._remap(display, keycode, keysym)
+                    with conn.timed("ChangeKeyboardMapping"):
+                        display.sync()
+                    self._clock.sleep(self.REMAP_SETTLE)
+
+                for keycode, level in keys:
+                    modifier = shift if level == 1 else altgr if level == 2 else 0
+                    if modifier:
+                        xtest.fake_input(display, X.KeyPress, modifier)
+                    xtest.fake_input(display, X.KeyPress, keycode)
+                    xtest.fake_input(display, X.KeyRelease, keycode)
+                    if modifier:
+                        xtest.fake_input(display, X.KeyRelease, modifier)
+                with conn.timed("XTestFakeInput"):
+                    display.sync()
+                sent += len(keys)
+        finally:
+            if remapped:
+                # Que los clientes procesen las teclas antes de deshacer el mapa
+                self._clock.sleep(self.REMAP_SETTLE)
+                for keycode, keysyms in remapped.items():
+                    display.change_keyboard_mapping(keycode, [keysyms])
+                display.sync()
+        return sent
+
+    def _batches(self, text: str, size: int):
+        # Los lotes no pueden necesitar más keycodes remapeados que los libres
+        batch: List[str] = []
+        unmapped = set()
+        display = self.conn.display
+        for char in text:
+            keysym = keysym_for_char(char)
+            needs_spare = self._lookup(display, keysym)[0] == 0
+            if len(batch) >= self.BATCH or (needs_spare and keysym not in unmapped and len(unmapped) >= size):
+                yield batch
+                batch, unmapped = [], set()
+            if needs_spare:
+                unmapped.add(keysym)
+            batch.append(char)
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _lookup(display, keysym: int) -> Tuple[int, int]:
+        for keycode, index in display.keysym_to_keycodes(keysym):
+            # index 0/1: grupo 1 normal/Shift; 4/5: AltGr en el mapa de XKB
+            if index in (0, 1):
+                return keycode, index
+            if index == 4:
+                return keycode, 2
+        return 0, 0
+
+    def _spare_keycodes(self, conn: XConnection) -> List[int]:
+        if self._spares is not None:
+            return self._spares
+        display = conn.display
+        first = display.display.info.min_keycode
+        count = display.display.info.max_keycode - first + 1
+        with conn.timed("GetKeyboardMapping"):
+            mapping = display.get_keyboard_mapping(first, count)
+        self._keysyms_per_keycode = len(mapping[0]) if mapping else 0
+        self._spares = [first + i for i, keysyms in enumerate(mapping)
+                        if not any(keysyms)][-8:]
+        return self._spares
+
+    def _current(self, display, keycode: int) -> List[int]:
+        return list(display.get_keyboard_mapping(keycode, 1)[0])
+
+    def _remap(self, display, keycode: int, keysym: int) -> None:
+        keysyms = [keysym, keysym] + [X.NoSymbol] * max(0, self._keysyms_per_keycode - 2)
+        display.change_keyboard_mapping(keycode, [keysyms])